@@ -15,13 +15,17 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import http.client
 import tkinter as tk
 from tkinter import ttk
+from tkinter import filedialog
 import numpy as np
 from LibConst import *
 from LibFeed import Feed, FeedType
 from LibAperture import Aperture, ApertureType
-from LibCalc import CalculationType, Calculation
+from LibCalc import CalculationType, CalculationEngine, Calculation
+from LibSurrogate import Surrogate
+from LibServer import CalcClient
 from LibTkExtension import LabelEntryPair, LabelPicklistPair, TracePlotWindow
 
 
@@ -51,6 +55,15 @@ aperture_data = Aperture()
 
 # --------- BEGIN Initialize the Calculation Data Object ---------
 calculation_data = Calculation()
+# Load the precomputed surrogate (built by running LibSurrogate.py) for the interactive Direct Calculation, if any.
+surrogate_data = Surrogate.load(surrogate_path)
+# Run as a thin client of the local calculation server (started by running LibServer.py), if enabled and available.
+calc_client = None
+if use_calc_server:
+    calc_client = CalcClient()
+    if not calc_client.is_available():
+        print("Calculation server is not available, calculating locally")
+        calc_client = None
 # --------- END Initialize the Calculation Data Object ---------
 
 
@@ -117,7 +130,7 @@ def update_calculation_parameter_gui(is_first_run=False):
     calculation_parameter_pairs.clear()
     for parameter in calculation_data.parameters:
         if isinstance(calculation_data.parameters[parameter], str):
-            pickable_parameters = list(feed_data.parameters.keys()) + list(aperture_data.parameters.keys())
+            pickable_parameters = Calculation.sweep_variable_names(feed_data, aperture_data)
             pair = LabelPicklistPair(calculation_parameter_frame, parameter, "", pickable_parameters)
             idx = pickable_parameters.index(calculation_data.parameters[parameter])
             pair.picklist.current(idx)
@@ -151,35 +164,120 @@ def calculate():
     print("Calculate and Plot")
     progress_bar['value'] = 0
     if calculation_data.type == CalculationType.DirectCalc:
-        taper_efficiency, spillover_efficiency = calculation_data.calc_taper_and_spillover_efficiency_oneshot(feed_data, aperture_data)
+        results = None
+        if use_surrogate.get():
+            results = surrogate_data.query(feed_data, aperture_data)
+        # Fall back to the exact solver if the surrogate is not used or not applicable
+        str_source = "Exact Solver" if results is None else "Surrogate"
+        if results is None and calc_client is not None:
+            try:
+                results = calc_client.calc_efficiencies_oneshot(feed_data, aperture_data, calculation_data.engine)
+            except (OSError, http.client.HTTPException):
+                # The calculation server is not reachable (any more), calculate locally instead
+                results = None
+            except RuntimeError as e:
+                tk.messagebox.showerror("Calculation Error", str(e))
+                return
+        if results is None:
+            results = calculation_data.calc_efficiencies_oneshot(feed_data, aperture_data)
+        taper_efficiency = results['Taper Efficiency']
+        spillover_efficiency = results['Spillover Efficiency']
         aperture_efficiency = taper_efficiency * spillover_efficiency
+        aperture_error = taper_efficiency * results['Spillover Error'] + spillover_efficiency * results['Taper Error']
         # Create a messagebox from tkinter showing the results
-        str_msg = "Taper Efficiency: {0:.2f}%\nSpillover Efficiency: {1:.2f}%\nTaper x Spillover Efficiency: {2:.2f}%".format(taper_efficiency * 100, spillover_efficiency * 100, aperture_efficiency * 100)
+        str_msg = "Taper Efficiency: {0:.2f}% (\u00b1{3:.2f}%)\nSpillover Efficiency: {1:.2f}% (\u00b1{4:.2f}%)\nTaper x Spillover Efficiency: {2:.2f}% (\u00b1{5:.2f}%)".format(
+            taper_efficiency * 100, spillover_efficiency * 100, aperture_efficiency * 100,
+            results['Taper Error'] * 100, results['Spillover Error'] * 100, aperture_error * 100)
+        if results['Blockage Efficiency'] < 1:
+            str_msg += "\nBlockage Efficiency: {0:.2f}%\nTaper x Spillover x Blockage Efficiency: {1:.2f}%".format(
+                results['Blockage Efficiency'] * 100, aperture_efficiency * results['Blockage Efficiency'] * 100)
+        if np.isnan(taper_efficiency):
+            str_msg = "The feed is at or below the aperture plane, it does not illuminate the aperture."
+        elif not results['Reliable']:
+            str_msg += "\nThe horizon of the feed crosses the aperture, the fixed node quadrature does not resolve it. Use the adaptive quadrature for reliable results."
+        str_msg += "\n({})".format(str_source)
         progress_bar['value'] = 100
         progress_bar.update_idletasks()
         tk.messagebox.showinfo("Results", str_msg)
     elif calculation_data.type == CalculationType.Sweep1D:
-        taper_efficiency, spillover_efficiency = calculation_data.sweep_taper_and_spillover_efficiencies_1d(feed_data, aperture_data, progressbar=progress_bar)
-        aperture_efficiency = taper_efficiency * spillover_efficiency
+        sweep_result = None
+        if calc_client is not None:
+            try:
+                sweep_result = calc_client.sweep_taper_and_spillover_efficiencies_1d(calculation_data, feed_data, aperture_data, progressbar=progress_bar)
+            except (OSError, http.client.HTTPException):
+                # The calculation server is not reachable (any more), calculate locally instead
+                sweep_result = None
+            except RuntimeError as e:
+                progress_bar['value'] = 0
+                tk.messagebox.showerror("Calculation Error", str(e))
+                return
+        if sweep_result is None:
+            sweep_result = calculation_data.sweep_taper_and_spillover_efficiencies_1d(feed_data, aperture_data, progressbar=progress_bar)
+        calculation_data.save_results(sweep_result)
+        taper_efficiency = sweep_result['Taper Efficiency']
+        spillover_efficiency = sweep_result['Spillover Efficiency']
+        aperture_efficiency = sweep_result.aperture_efficiency()
         plot_window = TracePlotWindow(root)
-        var_name = calculation_data.parameters['Sweep Variable']
-        var_start = calculation_data.parameters['Sweep Start']
-        var_end = calculation_data.parameters['Sweep Stop']
-        var_step = calculation_data.parameters['Sweep Steps'] 
-        var_linspace = np.linspace(var_start, var_end, var_step)
+        var_name = sweep_result.variable_names[0]
+        var_linspace = sweep_result.values[0]
         plot_window.add_trace(var_linspace, taper_efficiency*100, "Taper Efficiency") # TODO: Make it Dash Line
         plot_window.add_trace(var_linspace, spillover_efficiency*100, "Spillover Efficiency") # TODO: Make it Dash Line
         plot_window.add_trace(var_linspace, aperture_efficiency*100, "Taper x Spillover Efficiency")
+        blockage_efficiency = sweep_result['Blockage Efficiency']
+        if np.any(blockage_efficiency < 1):
+            plot_window.add_trace(var_linspace, blockage_efficiency*100, "Blockage Efficiency")
+            plot_window.add_trace(var_linspace, aperture_efficiency*blockage_efficiency*100, "Taper x Spillover x Blockage Efficiency")
+        # Mark the points whose errors can not be trusted on the Taper x Spillover trace
+        unreliable = sweep_result['Reliable'] == 0
+        if np.any(unreliable):
+            plot_window.add_trace(var_linspace[unreliable], aperture_efficiency[unreliable]*100, "Unreliable Points",
+                                  linestyle='none', marker='x', color='red')
         plot_window.set_title("Efficiencies (%)")
         plot_window.set_x_label(var_name)
         progress_bar['value'] = 100
         progress_bar.update_idletasks()
+        if np.any(unreliable):
+            tk.messagebox.showwarning("Unreliable Points", "{} of {} points are unreliable: the feed does not illuminate the aperture, or the fixed node quadrature does not resolve the horizon of the feed. Use the adaptive quadrature for reliable results.".format(
+                np.count_nonzero(unreliable), len(unreliable)))
         plot_window.show()
     elif calculation_data.type == CalculationType.Sweep2D:
         pass
     pass
 calculate_button = ttk.Button(calculation_command_frame, text="Calculate and Plot", command=calculate)
 calculate_button.pack(side=tk.TOP, fill=tk.X, expand=1)
+# Command Button: Export the results of the last sweep
+def export_results():
+    if calculation_data.results is None:
+        tk.messagebox.showinfo("Export Results", "No sweep results to export.")
+        return
+    # The format follows the selected file type, a missing extension is appended for the single file formats
+    file_type = tk.StringVar(value="NumPy Archive")
+    path = filedialog.asksaveasfilename(parent=root, title="Export Results", typevariable=file_type,
+                                        filetypes=[("NumPy Archive", "*.npz"), ("CSV", "*.csv"), ("Column Files", "*")])
+    if not path:
+        return
+    if file_type.get() == "Column Files":
+        calculation_data.results.to_columns(path)
+    elif file_type.get() == "CSV":
+        calculation_data.results.to_csv(path if path.endswith(".csv") else path + ".csv")
+    else:
+        calculation_data.results.to_npz(path if path.endswith(".npz") else path + ".npz")
+export_button = ttk.Button(calculation_command_frame, text="Export Results", command=export_results)
+export_button.pack(side=tk.TOP, fill=tk.X, expand=1)
+# Check Button: Use the surrogate for the Direct Calculation (only available if the surrogate is loaded)
+use_surrogate = tk.BooleanVar()
+use_surrogate.set(surrogate_data is not None)
+use_surrogate_checkbutton = ttk.Checkbutton(calculation_command_frame, text="Use Surrogate for Direct Calculation", variable=use_surrogate)
+use_surrogate_checkbutton.pack(side=tk.TOP, fill=tk.X, expand=1)
+if surrogate_data is None:
+    use_surrogate_checkbutton.state(['disabled'])
+# Check Button: Use the fixed node quadrature (reuses the aperture geometry across Q and frequency sweeps)
+use_fixed_nodes = tk.BooleanVar()
+use_fixed_nodes.set(calculation_data.engine == CalculationEngine.FixedNodes)
+def update_calculation_engine():
+    calculation_data.update_engine(CalculationEngine.FixedNodes if use_fixed_nodes.get() else CalculationEngine.Adaptive)
+use_fixed_nodes_checkbutton = ttk.Checkbutton(calculation_command_frame, text="Use Fixed Node Quadrature", variable=use_fixed_nodes, command=update_calculation_engine)
+use_fixed_nodes_checkbutton.pack(side=tk.TOP, fill=tk.X, expand=1)
 # ---------- END Create the Calculation Command Frame ----------
 
 
@@ -1,5 +1,8 @@
 from enum import Enum
+from functools import lru_cache
+import numpy as np
 from numpy import deg2rad
+from LibConst import *
 
 
 class ApertureType(Enum):
@@ -8,6 +11,89 @@ class ApertureType(Enum):
     Rectangular = "Rectangular Aperture"
 
 
+# ---------- BEGIN Aperture Functions ----------
+def clustered_gauss_legendre(a, b, clusters, n):
+    # n Gauss-Legendre nodes and weights over [a, b], clustered at the given (center, scale) pairs.
+    # A peak of width ~scale at a center (e.g. the 1/d^2 peak at the nadir of a low feed) is not resolved by
+    # evenly spread nodes. So [a, b] is split at the centers (and halfway between two centers), and each part
+    # is mapped by x = center +- scale*sinh(t), in which the peak is smooth. A center outside of [a, b] is
+    # moved to the nearest end with the scale widened accordingly. Clusters wider than half of [a, b] are
+    # ignored, without any cluster the plain Gauss-Legendre rule is returned.
+    u, v = np.polynomial.legendre.leggauss(n)
+    kept = []
+    for center, scale in sorted(clusters):
+        clipped = min(max(center, a), b)
+        scale = np.hypot(scale, center - clipped)
+        if not 0 < scale < (b - a) / 2:
+            continue
+        if kept and clipped - kept[-1][0] < min(scale, kept[-1][1]):
+            # Two centers within the width of a peak: keep the narrower one
+            if scale < kept[-1][1]:
+                kept[-1] = (clipped, scale)
+            continue
+        kept.append((clipped, scale))
+    if len(kept) == 0:
+        return (u + 1) / 2 * (b - a) + a, v / 2 * (b - a)
+    # Parts as (clustered end, other end, scale)
+    parts = []
+    ends = [a] + [(c0 + c1) / 2 for (c0, _), (c1, _) in zip(kept[:-1], kept[1:])] + [b]
+    for k, (center, scale) in enumerate(kept):
+        parts += [(center, ends[k], scale), (center, ends[k+1], scale)]
+    parts = [part for part in parts if part[0] != part[1]]
+    x, w = [], []
+    for k, (center, end, scale) in enumerate(parts):
+        u, v = np.polynomial.legendre.leggauss(n // len(parts) + (k < n % len(parts)))
+        t_max = np.arcsinh(abs(end - center) / scale)
+        t = (u + 1) / 2 * t_max
+        x.append(center + np.sign(end - center) * scale * np.sinh(t))
+        w.append(v / 2 * t_max * scale * np.cosh(t))
+    x, w = np.concatenate(x), np.concatenate(w)
+    order = np.argsort(x)
+    return x[order], w[order]
+
+@lru_cache(maxsize=aperture_nodes_cache_size)
+def aperture_nodes(type, parameters, n, clusters=()):
+    # Quadrature nodes over the aperture in m, cached per aperture geometry.
+    # type: ApertureType, parameters: tuple of (name, value) pairs in mm, n: number of nodes per dimension,
+    # clusters: tuple of (x, y, scale) in m, points of the aperture plane where the integrand has a peak of
+    # width ~scale (see clustered_gauss_legendre)
+    # Returns the read-only arrays x, y, w so that sum(f(x, y) * w) ~ integral of f over the aperture.
+    parameters = dict(parameters)
+    if type == ApertureType.Circular:
+        # Gauss-Legendre along r (with the Jacobian r), uniform (periodic trapezoidal rule) along phi,
+        # or Gauss-Legendre over one period if a cluster is off the center
+        r_max = parameters['Radius (mm)']*1e-3
+        r, w_r = clustered_gauss_legendre(0.0, r_max, [(np.hypot(x, y), scale) for x, y, scale in clusters], n)
+        w_r = w_r * r
+        clusters_phi = [(np.arctan2(y, x), scale / np.hypot(x, y)) for x, y, scale in clusters if np.hypot(x, y) > scale]
+        if len(clusters_phi) == 0:
+            phi = np.arange(2*n) * pi / n
+            w_phi = np.full(2*n, pi / n)
+        else:
+            phi_0 = clusters_phi[0][0]
+            clusters_phi = [((phi - phi_0 + pi) % (2*pi) + phi_0 - pi, scale) for phi, scale in clusters_phi]
+            phi, w_phi = clustered_gauss_legendre(phi_0 - pi, phi_0 + pi, clusters_phi, 2*n)
+        r, phi = np.meshgrid(r, phi, indexing='ij')
+        x = r * np.cos(phi)
+        y = r * np.sin(phi)
+        w = np.outer(w_r, w_phi)
+    else:
+        if type == ApertureType.Square:
+            size_x = size_y = parameters['Width (mm)']*1e-3
+        else:
+            size_x = parameters['X Length (mm)']*1e-3
+            size_y = parameters['Y Length (mm)']*1e-3
+        u, w_x = clustered_gauss_legendre(-size_x/2, size_x/2, [(x, scale) for x, _, scale in clusters], n)
+        v, w_y = clustered_gauss_legendre(-size_y/2, size_y/2, [(y, scale) for _, y, scale in clusters], n)
+        x, y = np.meshgrid(u, v, indexing='ij')
+        w = np.outer(w_x, w_y)
+    x, y, w = [np.ascontiguousarray(a.ravel()) for a in (x, y, w)]
+    for a in (x, y, w):
+        a.setflags(write=False)
+    return x, y, w
+# ---------- END Aperture Functions ----------
+
+
 class Aperture:
     def __init__(self):
         self.type = ApertureType.Circular
@@ -43,11 +129,38 @@ class Aperture:
         print("Updated {} to {}".format(name, value)) # Debugging
         return True     
         
+    def to_dict(self):
+        return {'Type': self.type.value, 'Parameters': dict(self.parameters)}
+
+    @classmethod
+    def from_dict(cls, data):
+        aperture = cls()
+        aperture.update_type(ApertureType(data['Type']))
+        aperture.parameters.update(data['Parameters'])
+        return aperture
+
     def print_parameters(self):
         for name in self.parameters:
             print(name, self.parameters[name])
         pass
 
+    def get_nodes(self, n=aperture_nodes_count, clusters=()):
+        return aperture_nodes(self.type, tuple(sorted(self.parameters.items())), n, tuple(clusters))
+
+    def get_rim_point(self, phi):
+        # Point (in m) on the rim of the aperture in the direction phi (rad) from the center
+        if self.type == ApertureType.Circular:
+            r = self.get_parameter_linear_SI('Radius (mm)')
+        else:
+            if self.type == ApertureType.Square:
+                half_x = half_y = self.get_parameter_linear_SI('Width (mm)') / 2
+            else:
+                half_x = self.get_parameter_linear_SI('X Length (mm)') / 2
+                half_y = self.get_parameter_linear_SI('Y Length (mm)') / 2
+            with np.errstate(divide='ignore'):
+                r = np.minimum(half_x / np.abs(np.cos(phi)), half_y / np.abs(np.sin(phi)))
+        return r * np.cos(phi), r * np.sin(phi)
+
     def get_parameter_linear_SI(self, name):
         if name not in self.parameters:
             return None
@@ -0,0 +1,165 @@
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from LibAperture import ApertureType, Aperture
+from LibFeed import FeedType, Feed
+from LibCalc import CalculationType, CalculationEngine, Calculation
+from LibResult import RESULT_NAMES
+from LibConst import *
+
+
+# Scenario file format (JSON):
+# {
+#     "Scenarios": [
+#         {
+#             "Name": "Design A",
+#             "Feed": {"Type": "E(Theta) = cos(Theta)^Q", "Parameters": {"HPBW (deg)": 30, "PosZ (mm)": 100}},
+#             "Aperture": {"Type": "Circular Aperture", "Parameters": {"Radius (mm)": 80}},
+#             "Calculation": {"Type": "Linear 1D Sweep", "Engine": "Fixed Node Quadrature",
+#                             "Parameters": {"Sweep Variable": "PosZ (mm)", ...}}
+#         },
+#         ...
+#     ]
+# }
+# The types are the values of FeedType, ApertureType and CalculationType, the engine is a value of
+# CalculationEngine. The parameters start from the defaults and are applied in the given order with
+# update_parameter, so the dependent parameters (e.g. Q from HPBW) are derived as in the GUI.
+# "Type", "Engine" and "Calculation" are optional.
+# A scenario that fails is reported by a single row with the message in 'Error' and NaN results.
+
+TABLE_COLUMNS = ['Scenario', 'Feed Type', 'Aperture Type', 'Sweep Variable', 'Sweep Value'] + RESULT_NAMES + ['Error']
+
+
+# ---------- BEGIN Scenario Functions ----------
+def scenario_object(cls, type_enum, data):
+    obj = cls()
+    if 'Type' in data:
+        obj.update_type(type_enum(data['Type']))
+    for name, value in data.get('Parameters', {}).items():
+        if not obj.update_parameter(name, value):
+            raise ValueError("Invalid value {} for {}".format(value, name))
+    return obj
+
+
+def load_scenarios(path):
+    # Returns a list of (name, feed, aperture, calculation)
+    with open(path, "r") as f:
+        data = json.load(f)
+    scenarios = []
+    for k, scenario in enumerate(data['Scenarios']):
+        name = scenario.get('Name', "Scenario {}".format(k))
+        feed = scenario_object(Feed, FeedType, scenario.get('Feed', {}))
+        aperture = scenario_object(Aperture, ApertureType, scenario.get('Aperture', {}))
+        calculation = scenario_object(Calculation, CalculationType, scenario.get('Calculation', {}))
+        if 'Engine' in scenario.get('Calculation', {}):
+            calculation.update_engine(CalculationEngine(scenario['Calculation']['Engine']))
+        if calculation.type == CalculationType.Sweep1D:
+            var_name = calculation.parameters['Sweep Variable']
+            if var_name not in Calculation.sweep_variable_names(feed, aperture):
+                raise ValueError("Invalid Sweep Variable {} in {}".format(var_name, name))
+        scenarios.append((name, feed, aperture, calculation))
+    return scenarios
+
+
+def group_key(feed: Feed, aperture: Aperture):
+    # Scenarios sharing the aperture geometry and the feed position share the geometry contexts
+    # (the quadrature nodes and the kernels of the fixed node quadrature, see run_scenario_group).
+    _, vec_feed, _ = Calculation.feed_values_linear_SI(feed)
+    return (aperture.type.value, tuple(sorted(aperture.parameters.items())), tuple(vec_feed))
+
+
+def scenario_key(feed: Feed, aperture: Aperture, calculation: Calculation):
+    return json.dumps({'Feed': feed.to_dict(), 'Aperture': aperture.to_dict(), 'Calculation': calculation.to_dict()}, sort_keys=True)
+# ---------- END Scenario Functions ----------
+
+
+# ---------- BEGIN Worker Functions ----------
+def run_scenario(feed: Feed, aperture: Aperture, calculation: Calculation):
+    # Returns a list of (sweep variable, sweep value, results) rows
+    if calculation.type == CalculationType.DirectCalc:
+        results = calculation.calc_efficiencies_oneshot(feed, aperture)
+        if results is None:
+            raise ValueError("{} does not support {}".format(calculation.engine.value, feed.type.value))
+        return [("", "", results)]
+    if calculation.type == CalculationType.Sweep1D:
+        sweep_result = calculation.sweep_taper_and_spillover_efficiencies_1d(feed, aperture)
+        var_name = sweep_result.variable_names[0]
+        return [(var_name, value, {name: sweep_result[name][i] for name in RESULT_NAMES})
+                for i, value in enumerate(sweep_result.values[0])]
+    raise ValueError("Unsupported calculation type {}".format(calculation.type.value))
+
+
+def run_scenario_group(scenarios):
+    # scenarios: list of (key, feed, aperture, calculation) of the same group (see group_key).
+    # The scenarios share the geometry contexts, so the geometry is only computed again when the beam
+    # width of the feed changes (see kernel_peaks).
+    # Returns a list of (key, rows, error), a failed scenario has no rows and the error message.
+    geometry_contexts = {}
+    group_results = []
+    for key, feed, aperture, calculation in scenarios:
+        calculation.geometry_contexts = geometry_contexts
+        try:
+            group_results.append((key, run_scenario(feed, aperture, calculation), ""))
+        except Exception as error:
+            group_results.append((key, [], "{}: {}".format(type(error).__name__, error)))
+    return group_results
+# ---------- END Worker Functions ----------
+
+
+def run_batch(scenarios, workers=None):
+    # Returns the consolidated result table as a list of dicts with the keys TABLE_COLUMNS.
+    # Identical scenarios are calculated once. The unique scenarios are grouped by group_key, and
+    # the groups are split into chunks so that a large group is still spread over all workers.
+    groups = {}
+    n_unique = 0
+    for name, feed, aperture, calculation in scenarios:
+        key = scenario_key(feed, aperture, calculation)
+        group = groups.setdefault(group_key(feed, aperture), {})
+        if key not in group:
+            group[key] = (key, feed, aperture, calculation)
+            n_unique += 1
+    n_workers = workers if workers is not None else os.cpu_count()
+    chunk_size = max(-(-n_unique // n_workers), 1)
+    chunks = []
+    for group in groups.values():
+        # Neighbouring Q values share the beam width, and thus the geometry context
+        group = sorted(group.values(), key=lambda scenario: scenario[1].parameters['Q'])
+        chunks += [group[k:k + chunk_size] for k in range(0, len(group), chunk_size)]
+
+    rows_of_scenario = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for group_results in pool.map(run_scenario_group, chunks):
+            rows_of_scenario.update({key: (rows, error) for key, rows, error in group_results})
+
+    table = []
+    for name, feed, aperture, calculation in scenarios:
+        rows, error = rows_of_scenario[scenario_key(feed, aperture, calculation)]
+        if error:
+            results = {result_name: np.nan for result_name in RESULT_NAMES}
+            results['Reliable'] = 0.0
+            rows = [("", "", results)]
+        for var_name, value, results in rows:
+            row = {'Scenario': name, 'Feed Type': feed.type.value, 'Aperture Type': aperture.type.value,
+                   'Sweep Variable': var_name, 'Sweep Value': value, 'Error': error}
+            row.update({result_name: float(results[result_name]) for result_name in RESULT_NAMES})
+            table.append(row)
+    return table
+
+
+def save_table(table, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=TABLE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(table)
+
+
+if __name__ == "__main__":
+    # Usage: python LibBatch.py <scenario file> <result table (csv)> [number of workers]
+    if len(sys.argv) < 3:
+        print("Usage: python LibBatch.py <scenario file> <result table (csv)> [number of workers]")
+        sys.exit(1)
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    save_table(run_batch(load_scenarios(sys.argv[1]), workers), sys.argv[2])
@@ -0,0 +1,40 @@
+import numpy as np
+from LibAperture import Aperture
+from LibConst import *
+
+
+# Blockage of the collimated beam reflected by the aperture (along +z) by the feed and its support struts.
+# The shadow is the projection of the feed housing (a disk) and of the struts (straight strips from the
+# feed to the rim of the aperture, equally spaced in azimuth starting at phi = 0) onto the aperture plane.
+# The blockage efficiency is (1 - integral of the field over the shadow / integral of the field over the aperture)^2.
+
+
+# ---------- BEGIN Blockage Functions ----------
+def blockage_mask(x, y, vec_feed, aperture: Aperture, housing_radius, strut_count, strut_width):
+    # Returns a boolean array, True for the nodes (x, y) in the shadow. Lengths are in m.
+    x_feed, y_feed = vec_feed[0], vec_feed[1]
+    mask = (x - x_feed)**2 + (y - y_feed)**2 <= housing_radius**2
+    if strut_count <= 0 or strut_width <= 0:
+        return mask
+    for k in range(int(strut_count)):
+        x_rim, y_rim = aperture.get_rim_point(2*pi*k/int(strut_count))
+        dx = x_rim - x_feed
+        dy = y_rim - y_feed
+        length = np.hypot(dx, dy)
+        if length == 0:
+            continue
+        # Coordinates of the nodes along and across the strut
+        along = ((x - x_feed)*dx + (y - y_feed)*dy) / length
+        across = ((x - x_feed)*dy - (y - y_feed)*dx) / length
+        mask |= (along >= 0) & (along <= length) & (np.abs(across) <= strut_width/2)
+    return mask
+
+
+def blockage_efficiency(field, w, mask):
+    # field: aperture field at the nodes, w: quadrature weights, mask: nodes in the shadow
+    field_total = np.sum(field * w)
+    if field_total == 0:
+        return 1.0
+    field_blocked = np.sum(field[mask] * w[mask])
+    return float((1 - field_blocked / field_total)**2)
+# ---------- END Blockage Functions ----------
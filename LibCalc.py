@@ -1,9 +1,13 @@
 from enum import Enum
 from LibAperture import ApertureType, Aperture
-from LibFeed import FeedType, Feed
+from LibFeed import FeedType, Feed, FeedArray
+from LibBlockage import blockage_efficiency
+from LibGeometry import GeometryContext, kernel_peaks, incidence_geometry, power_kernel, field_kernel
 import numpy as np
-from scipy.integrate import nquad
+from scipy.integrate import quad
 from copy import deepcopy
+from time import perf_counter
+from LibResult import SweepResult, RESULT_NAMES
 from LibConst import *
 
 
@@ -13,24 +17,78 @@ pi = np.pi
 cos = np.cos
 sin = np.sin
 cos_vec = lambda v1, v2: v1 @ v2 / (norm(v1)*norm(v2))
-def dblquad(func, x0, x1, y0, y1, epsabs=1e-3, epsrel=1e-3, max_iter=10):
-    return nquad(func, [[x0, x1], [y0, y1]], 
-                 opts=[{'limit': max_iter, 'epsabs': epsabs, 'epsrel': epsrel}, 
-                       {'limit': max_iter, 'epsabs': epsabs, 'epsrel': epsrel}])
+def dblquad(func, x0, x1, y0, y1, epsabs=1e-3, epsrel=1e-3, max_iter=10, points=None, points_y=None):
+    # Integral of func(x, y) with the inner variable x and the outer variable y. Returns the value and its error estimate.
+    # points: optional function of the outer variable y, returning the breakpoints of the inner variable x
+    # (e.g. discontinuities of the integrand), which are passed to quad to split the inner domain.
+    # points_y: optional list of the breakpoints of the outer variable y.
+    def quad_opts(breakpoints):
+        # Repeated breakpoints (e.g. the nadir of a feed on the axis) are passed once
+        breakpoints = sorted(set(float(p) for p in breakpoints))
+        if len(breakpoints) == 0:
+            return {'limit': max_iter, 'epsabs': epsabs, 'epsrel': epsrel}
+        # quad needs more subintervals than breakpoints
+        return {'limit': max(max_iter, len(breakpoints) + 2), 'epsabs': epsabs, 'epsrel': epsrel, 'points': breakpoints}
+    opts_y = quad_opts([p for p in points_y if y0 < p < y1] if points_y is not None else [])
+    inner_errors = []
+    def inner(y):
+        opts_x = quad_opts([p for p in points(y) if x0 < p < x1] if points is not None else [])
+        value, error = quad(func, x0, x1, args=(y,), **opts_x)
+        inner_errors.append((y, error))
+        return value
+    value, error = quad(inner, y0, y1, **opts_y)
+    # The errors of the inner integrals are per unit length of y, so they are integrated over y (trapezoidal
+    # rule over the abscissae of the outer quadrature, which cluster where the outer integrand is difficult)
+    # instead of being compared with the error of the outer integral.
+    y_samples, inner_error_samples = np.array(sorted(inner_errors)).T
+    y_samples = np.concatenate([[y0], y_samples, [y1]])
+    inner_error_samples = np.concatenate([inner_error_samples[:1], inner_error_samples, inner_error_samples[-1:]])
+    return value, error + float(np.trapezoid(inner_error_samples, y_samples))
 # ---------- END Common Functions from Numpy ----------
 
 
+def total_feed_power(feed_type, q, epsabs=quad_error, epsrel=quad_error, max_iter=max_iter):
+    # Returns the normalized total power of the feed and its error estimate.
+    if feed_type == FeedType.Cos_theta_q:
+        # Closed form of the integral of cos(theta)^(2Q) sin(theta) over the upper hemisphere
+        # (the same as in q_to_gain_lin of LibFeed), exact for any Q.
+        return 2*pi/(2*q + 1), 0.0
+    return None
+
+
+def feed_illuminates_aperture(vec_feed):
+    # False for a feed at or below the aperture plane. PosTheta = 90 deg leaves a rounding residue of z,
+    # so z is compared relative to the distance of the feed.
+    return bool(vec_feed[2] > 1e-12 * norm(vec_feed))
+
+
+def invalid_feed_results():
+    # Results for a feed that does not illuminate the aperture (at or below the aperture plane):
+    # there is no power on the aperture, so the efficiencies are undefined.
+    results = {name: np.nan for name in ['Taper Efficiency', 'Spillover Efficiency', 'Taper Error', 'Spillover Error', 'Blockage Efficiency']}
+    results['Reliable'] = False
+    return results
+
+
 class CalculationType(Enum):
     DirectCalc = "Direct Calculation"
     Sweep1D = "Linear 1D Sweep"
     #Sweep2D = "Linear 2D Sweep" # TODO: Implement Sweep 2D
 
 
+class CalculationEngine(Enum):
+    Adaptive = "Adaptive Quadrature"
+    FixedNodes = "Fixed Node Quadrature"
+
+
 class Calculation:
     def __init__(self):
         self.type = CalculationType.DirectCalc
+        self.engine = CalculationEngine.Adaptive
         self.__init__parameters()
         self.results = None
+        # Geometry contexts of the fixed node quadrature, one per number of nodes, rebuilt when the geometry changes
+        self.geometry_contexts = {}
         pass
 
     def __init__parameters(self):
@@ -54,7 +112,7 @@ class Calculation:
         else:
             pass
     
-    def save_results(self, results):
+    def save_results(self, results: SweepResult):
         self.results = results
 
     def empty_results(self):
@@ -63,6 +121,35 @@ class Calculation:
     def update_type(self, type):
         self.type = type
         self.__init__parameters()
+
+    def update_engine(self, engine):
+        self.engine = engine
+
+    def to_dict(self):
+        return {'Type': self.type.value, 'Engine': self.engine.value, 'Parameters': dict(self.parameters)}
+
+    @classmethod
+    def from_dict(cls, data):
+        calculation = cls()
+        calculation.update_type(CalculationType(data['Type']))
+        if 'Engine' in data:
+            calculation.update_engine(CalculationEngine(data['Engine']))
+        calculation.parameters.update(data['Parameters'])
+        return calculation
+
+    @staticmethod
+    def sweep_variable_names(feed: Feed, aperture: Aperture):
+        # Names of the parameters that can be swept. The number of struts is not a continuous variable,
+        # a linear sweep of it would only repeat the rounded values.
+        names = list(feed.parameters.keys()) + list(aperture.parameters.keys())
+        return [name for name in names if name != 'Strut Count']
+
+    def get_geometry_context(self, aperture: Aperture, vec_feed, n=aperture_nodes_count, q=None):
+        context = self.geometry_contexts.get(n)
+        if context is None or not context.matches(aperture, vec_feed, n, q):
+            context = GeometryContext(aperture, vec_feed, n, q)
+            self.geometry_contexts[n] = context
+        return context
     
     def update_parameter(self, name, value):
         if name not in self.parameters:
@@ -87,61 +174,169 @@ class Calculation:
 
     # TODO: Add messagebox when computation error is occurred.
     def calc_taper_and_spillover_efficiency_oneshot(self, feed: Feed, aperture: Aperture):
-        # Common variables for calculation
+        results = self.calc_efficiencies_oneshot(feed, aperture)
+        return results['Taper Efficiency'], results['Spillover Efficiency']
+
+    @staticmethod
+    def feed_values_linear_SI(feed: Feed):
+        # Common variables for calculation: Q, position (in m) and blockage geometry of the feed
         q = feed.get_parameter_linear_SI('Q')
         x_feed = feed.get_parameter_linear_SI("PosX (mm)")
         y_feed = feed.get_parameter_linear_SI("PosY (mm)")
         z_feed = feed.get_parameter_linear_SI("PosZ (mm)")
         vec_feed = np.array([x_feed, y_feed, z_feed])
+        return q, vec_feed, feed.get_blockage_linear_SI()
 
-        # Get the field strength (sqrt of intensity) along theta for a given feed type
-        if feed.type == FeedType.Cos_theta_q:
-            def field_strength_along_theta(theta):
-                return cos(theta)**q
-        else:
-            field_strength_along_theta = None
-        
-        # Calculate the normalized total power of the feed (Solid Angle Integration)
-        def total_power_integrant(theta, phi):
-            return field_strength_along_theta(theta)**2 * sin(theta)
-        total_power, _ = dblquad(total_power_integrant, 0, pi/2, 0, pi*2, 
-                                 epsabs=quad_error, epsrel=quad_error, max_iter=max_iter)
+    def calc_efficiencies_oneshot(self, feed: Feed, aperture: Aperture):
+        # Same as calc_taper_and_spillover_efficiency_oneshot, but the error estimates of the
+        # integrations are kept and propagated to the efficiencies.
+        # Returns a dict with the keys 'Taper Efficiency', 'Spillover Efficiency', 'Taper Error',
+        # 'Spillover Error' and 'Blockage Efficiency'.
+        q, vec_feed, blockage = self.feed_values_linear_SI(feed)
+        return self.calc_efficiencies_from_feed_values(feed.type, q, vec_feed, aperture, blockage)
+
+    def calc_efficiencies_from_feed_values(self, feed_type, q, vec_feed, aperture: Aperture, blockage=(0.0, 0, 0.0)):
+        # Same as calc_efficiencies_oneshot, with the feed given by its type, Q, position (in m) and
+        # blockage geometry (see Feed.get_blockage_linear_SI), calculated with the selected engine.
+        # This is the entry point for the batched sweeps over a FeedArray.
+        if self.engine == CalculationEngine.FixedNodes:
+            return self.calc_efficiencies_fixed_nodes(feed_type, q, vec_feed, aperture, blockage)
+        return self.calc_efficiencies_adaptive(feed_type, q, vec_feed, aperture, blockage)
+
+    def calc_efficiencies_fixed_nodes(self, feed_type, q, vec_feed, aperture: Aperture, blockage=(0.0, 0, 0.0), n=aperture_nodes_count):
+        # Fixed node (Gauss-Legendre) quadrature over a cached GeometryContext, so the geometry is only
+        # computed again when the aperture or the feed position changes (and for a Q sweep only when the
+        # beam width crosses a power of 2, see kernel_peaks). The nodes are clustered at the nadir of the
+        # feed and at the beam center, where the integrands peak.
+        # The errors are estimates, not bounds: the difference to the same quadrature with half of the nodes,
+        # plus the contribution of the nodes next to the horizon if it crosses the aperture (see
+        # GeometryContext.error_near_cut). If an estimate exceeds quad_error, the nodes do not resolve the
+        # integrands and the adaptive quadrature is used instead. 'Reliable' is False if the horizon crosses
+        # the aperture, the kink is not resolved then and the estimate may be too small.
+        results = self.calc_efficiencies_fixed_nodes_array(feed_type, np.array([q], dtype=float), vec_feed, aperture, blockage, n)
+        return None if results is None else results[0]
+
+    def calc_efficiencies_fixed_nodes_array(self, feed_type, q_array, vec_feed, aperture: Aperture, blockage=(0.0, 0, 0.0), n=aperture_nodes_count):
+        # Same as calc_efficiencies_fixed_nodes for an array of Q values at one feed position, e.g. a sweep of
+        # Q, HPBW, gain or frequency. Each distinct Q is calculated once (Q does not change with the frequency),
+        # and the Q values sharing a geometry context are integrated in one call.
+        # Returns a list of result dicts, one per Q.
+        if feed_type != FeedType.Cos_theta_q:
+            return None
+        q_array, inverse = np.unique(np.asarray(q_array, dtype=float), return_inverse=True)
+        if not feed_illuminates_aperture(vec_feed):
+            return [invalid_feed_results() for _ in inverse]
+        groups = {}
+        for i, q in enumerate(q_array):
+            groups.setdefault(kernel_peaks(vec_feed, q), []).append(i)
+
+        results = [None] * len(q_array)
+        for indices in groups.values():
+            q = q_array[indices]
+            total_power, _ = total_feed_power(feed_type, q)
+            efficiencies = []
+            for n_nodes in [n, n // 2]:
+                context = self.get_geometry_context(aperture, vec_feed, n_nodes, q[0])
+                total_power_on_aperture = context.power_integral(q)
+                field_sum = context.field_integral(q)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    taper_efficiency = (field_sum / context.area)**2 * context.area / total_power_on_aperture
+                spillover_efficiency = total_power_on_aperture / total_power
+                efficiencies.append((taper_efficiency, spillover_efficiency))
+                if n_nodes == n:
+                    illuminated = total_power_on_aperture > 0
+                    power_near_cut, field_near_cut = context.error_near_cut(q)
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        rel_error_power_on_aperture = power_near_cut / total_power_on_aperture
+                        rel_error_field = field_near_cut / field_sum
+                    reliable = not context.horizon_crossed
+            taper_error = (np.abs(efficiencies[0][0] - efficiencies[1][0])
+                           + efficiencies[0][0] * (2*rel_error_field + rel_error_power_on_aperture))
+            spillover_error = (np.abs(efficiencies[0][1] - efficiencies[1][1])
+                               + efficiencies[0][1] * rel_error_power_on_aperture)
+
+            for k, i in enumerate(indices):
+                if not illuminated[k]:
+                    results[i] = invalid_feed_results()
+                elif not (taper_error[k] <= quad_error and spillover_error[k] <= quad_error):
+                    results[i] = self.calc_efficiencies_adaptive(feed_type, q[k], vec_feed, aperture, blockage)
+                else:
+                    results[i] = {}
+                    results[i]['Taper Efficiency'] = float(efficiencies[0][0][k])
+                    results[i]['Spillover Efficiency'] = float(efficiencies[0][1][k])
+                    results[i]['Taper Error'] = float(taper_error[k])
+                    results[i]['Spillover Error'] = float(spillover_error[k])
+                    results[i]['Blockage Efficiency'] = self.calc_blockage_efficiency(q[k], vec_feed, aperture, blockage)
+                    results[i]['Reliable'] = reliable
+        return [dict(results[i]) for i in inverse]
+
+    def calc_blockage_efficiency(self, q, vec_feed, aperture: Aperture, blockage=(0.0, 0, 0.0), tolerance=None):
+        # Blockage by the feed and its struts, evaluated in one vectorized pass over the nodes of the geometry context.
+        # The nodes do not resolve the edges of the shadow, so with a tolerance (adaptive engine) the number of
+        # nodes is doubled until two passes agree within it, up to blockage_max_nodes_count.
+        housing_radius, strut_count, strut_width = blockage
+        if not (housing_radius > 0 or (strut_count > 0 and strut_width > 0)):
+            return 1.0
+        n = aperture_nodes_count
+        efficiency = None
+        while True:
+            context = self.get_geometry_context(aperture, vec_feed, n, q)
+            mask = context.blockage_mask(housing_radius, strut_count, strut_width)
+            previous, efficiency = efficiency, blockage_efficiency(context.field(q), context.w, mask)
+            if tolerance is None or n >= blockage_max_nodes_count or (previous is not None and abs(efficiency - previous) <= tolerance):
+                return efficiency
+            n *= 2
+
+    def calc_efficiencies_adaptive(self, feed_type, q, vec_feed, aperture: Aperture, blockage=(0.0, 0, 0.0),
+                                   epsabs=quad_error, epsrel=quad_error, max_iter=max_iter):
+        # Adaptive quadrature (nested quad, see dblquad) of the integrals, with the given tolerances and subdivision limit.
+        if not feed_illuminates_aperture(vec_feed):
+            return invalid_feed_results()
+        # Calculate the normalized total power of the feed (closed form, it only depends on the feed normalization)
+        total_power, total_power_error = total_feed_power(feed_type, float(q), epsabs, epsrel, max_iter)
+
+        # The horizon of the feed is the line of the aperture plane where cos_theta = 0, i.e. x*x_feed + y*y_feed = |feed|^2.
+        # The integrands are cut off there, so the integration domain is split at the horizon.
+        # For a low feed the 1/d^2 peak at its nadir (x_feed, y_feed) is sharp, so the domain is also split there.
+        feed_len_squared = vec_feed @ vec_feed
+        # For large Q the beam is narrow compared to the aperture, so the domain is also split around the
+        # footprint of the main beam (a few half power widths around the aperture center).
+        # For Q = 0 the beam covers the whole half space (and the width is infinite), for Q < 0 it is NaN,
+        # in both cases no breakpoint falls inside the aperture.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            beam_width = beam_footprint_factor * np.sqrt(feed_len_squared) * np.tan(np.arccos(np.power(2.0, -1/(2*np.float64(q)))))
 
         # Calculate the powers based on the integration domain of the aperture
         if aperture.type == ApertureType.Circular:
-            # Calculate the total power on the aperture (Cartesian to Solid-Angle Integration)
             r_max = aperture.get_parameter_linear_SI("Radius (mm)")
             area = pi * r_max**2
+            def horizon_points(phi):
+                # The nadir is nearest at r = radial, the horizon is crossed at r = |feed|^2 / radial
+                radial = cos(phi) * vec_feed[0] + sin(phi) * vec_feed[1]
+                return [beam_width, radial, feed_len_squared / radial] if radial > 0 else [beam_width]
+            # Split the outer (phi) domain at the azimuth of the nadir and where the horizon crosses the rim
+            rho_feed = np.hypot(vec_feed[0], vec_feed[1])
+            phi_points = []
+            if rho_feed > 0:
+                phi_feed = np.arctan2(vec_feed[1], vec_feed[0])
+                phi_points.append(phi_feed)
+                if feed_len_squared < r_max * rho_feed:
+                    phi_rim = np.arccos(feed_len_squared / (r_max * rho_feed))
+                    phi_points += [phi_feed - phi_rim, phi_feed + phi_rim]
+            phi_points = [np.mod(phi, 2*pi) for phi in phi_points]
+
+            # Calculate the total power on the aperture (Cartesian to Solid-Angle Integration)
             def total_power_on_aperture_integrant(r, phi):
-                x = r * cos(phi)
-                y = r * sin(phi)
-                vec_pos = np.array([x, y, 0])
-                vec_incidence = vec_pos - vec_feed
-                vec_incidence_len = norm(vec_incidence)
-                dir_incidence = vec_incidence / vec_incidence_len
-                cos_theta = -1 * dir_incidence @ vec_feed / norm(vec_feed)
-                projection = dir_incidence @ np.array([0, 0, -1])
-                return cos_theta**(q*2) / vec_incidence_len**2 * projection * r
-            total_power_on_aperture, _ = dblquad(total_power_on_aperture_integrant, 0, r_max, 0, pi*2, 
-                                                 epsabs=quad_error, epsrel=quad_error, max_iter=max_iter)
+                return float(power_kernel(q, *incidence_geometry(r * cos(phi), r * sin(phi), vec_feed))) * r
+            total_power_on_aperture, total_power_on_aperture_error = dblquad(
+                total_power_on_aperture_integrant, 0, r_max, 0, pi*2, 
+                epsabs=epsabs, epsrel=epsrel, max_iter=max_iter, points=horizon_points, points_y=phi_points)
 
             # Calculate the power of the average incidence on the aperture (Cartesian to Solid-Angle Integration)
             def field_integrant(r, phi):
-                x = r * cos(phi)
-                y = r * sin(phi)
-                vec_pos = np.array([x, y, 0])
-                vec_incidence = vec_pos - vec_feed
-                vec_incidence_len = norm(vec_incidence) 
-                dir_incidence = vec_incidence / vec_incidence_len
-                cos_theta = -1 * dir_incidence @ vec_feed / norm(vec_feed)
-                projection = dir_incidence @ np.array([0, 0, -1])
-                return cos_theta**(q) / vec_incidence_len* r * projection**0.5
-            field_avg, _ = dblquad(field_integrant, 0, r_max, 0, pi*2, 
-                                   epsabs=quad_error, epsrel=quad_error, max_iter=max_iter)
-
-
-            field_avg /= area
-            total_power_of_field_avg = field_avg**2 * area
+                return float(field_kernel(q, *incidence_geometry(r * cos(phi), r * sin(phi), vec_feed))) * r
+            field_sum, field_sum_error = dblquad(field_integrant, 0, r_max, 0, pi*2, 
+                                                 epsabs=epsabs, epsrel=epsrel, max_iter=max_iter, points=horizon_points, points_y=phi_points)
 
         elif aperture.type == ApertureType.Rectangular or aperture.type == ApertureType.Square:
             # Get the integration limits
@@ -160,72 +355,163 @@ class Calculation:
                 x1 = size_x/2
                 y0 = -size_y/2
                 y1 = size_y/2
-            
+            beam_points = [-beam_width, 0.0, beam_width]
+            def horizon_points(y):
+                if vec_feed[0] == 0:
+                    return beam_points + [vec_feed[0]]
+                return beam_points + [vec_feed[0], (feed_len_squared - y * vec_feed[1]) / vec_feed[0]]
+            # Split the outer (y) domain at the nadir and where the horizon crosses the edges x0 and x1
+            # (for x_feed = 0 the horizon is the line y = |feed|^2 / y_feed)
+            y_points = beam_points + [vec_feed[1]]
+            if vec_feed[1] != 0:
+                y_points += [(feed_len_squared - x * vec_feed[0]) / vec_feed[1] for x in (x0, x1)]
+
             # Calculate the total power on the aperture (Cartesian to Solid-Angle Integration)
             def total_power_on_aperture_integrant(x, y):
-                vec_pos = np.array([x, y, 0])
-                vec_incidence = vec_pos - vec_feed
-                vec_incidence_len = norm(vec_incidence)
-                dir_incidence = vec_incidence / vec_incidence_len
-                cos_theta = -1 * dir_incidence @ vec_feed / norm(vec_feed)
-                projection = dir_incidence @ np.array([0, 0, -1])
-                return cos_theta**(q*2) / vec_incidence_len**2 * projection
-            total_power_on_aperture, _ = dblquad(total_power_on_aperture_integrant, x0, x1, y0, y1, 
-                                                 epsabs=quad_error, epsrel=quad_error, max_iter=max_iter)
+                return float(power_kernel(q, *incidence_geometry(x, y, vec_feed)))
+            total_power_on_aperture, total_power_on_aperture_error = dblquad(
+                total_power_on_aperture_integrant, x0, x1, y0, y1, 
+                epsabs=epsabs, epsrel=epsrel, max_iter=max_iter, points=horizon_points, points_y=y_points)
 
             # Calculate the power of the average incidence on the aperture (Cartesian to Solid-Angle Integration)
             def field_integrant(x, y):
-                vec_pos = np.array([x, y, 0])
-                vec_incidence = vec_pos - vec_feed
-                vec_incidence_len = norm(vec_incidence) 
-                dir_incidence = vec_incidence / vec_incidence_len
-                cos_theta = -1 * dir_incidence @ vec_feed / norm(vec_feed)
-                projection = dir_incidence @ np.array([0, 0, -1])
-                return cos_theta**(q) / vec_incidence_len * projection**0.5
-            field_avg, _ = dblquad(field_integrant, x0, x1, y0, y1, 
-                                   epsabs=quad_error, epsrel=quad_error, max_iter=max_iter)
-
-            field_avg /= area
-            total_power_of_field_avg = field_avg**2 * area
+                return float(field_kernel(q, *incidence_geometry(x, y, vec_feed)))
+            field_sum, field_sum_error = dblquad(field_integrant, x0, x1, y0, y1, 
+                                                 epsabs=epsabs, epsrel=epsrel, max_iter=max_iter, points=horizon_points, points_y=y_points)
 
         else:
-            taper_efficiency = 0
+            return None
 
+        if not total_power_on_aperture > 0:
+            return invalid_feed_results()
+
+        # Taper = (field_sum/area)^2 * area / total_power_on_aperture
+        # Spillover = total_power_on_aperture / total_power
+        field_avg = field_sum / area
+        total_power_of_field_avg = field_avg**2 * area
         taper_efficiency = total_power_of_field_avg / total_power_on_aperture
         spillover_efficiency = total_power_on_aperture / total_power
-        return taper_efficiency, spillover_efficiency
 
-    def sweep_taper_and_spillover_efficiencies_1d(self, feed: Feed, aperture: Aperture, progressbar=None):
-        # The general idea of sweeping is that:
-        # First store a record of the feed and aperture as a back up.
-        # In the sweep loop, for each point to be calculated, update the parameters of the feed and aperture.
-        feed_sweep = deepcopy(feed)
-        aperture_sweep = deepcopy(aperture)
+        # First-order propagation of the absolute integration errors into the efficiencies
+        rel_error_field = abs(field_sum_error / field_sum)
+        rel_error_power_on_aperture = abs(total_power_on_aperture_error / total_power_on_aperture)
+        rel_error_total_power = abs(total_power_error / total_power)
+        taper_error = abs(taper_efficiency) * (2*rel_error_field + rel_error_power_on_aperture)
+        spillover_error = abs(spillover_efficiency) * (rel_error_power_on_aperture + rel_error_total_power)
 
-        if not self.type == CalculationType.Sweep1D:
-            return None
+        results = {}
+        results['Taper Efficiency'] = taper_efficiency
+        results['Spillover Efficiency'] = spillover_efficiency
+        results['Taper Error'] = taper_error
+        results['Spillover Error'] = spillover_error
+        results['Blockage Efficiency'] = self.calc_blockage_efficiency(q, vec_feed, aperture, blockage, tolerance=epsabs)
+        results['Reliable'] = True
+        return results
+
+    def calc_efficiencies_reference(self, feed: Feed, aperture: Aperture, tolerance=quad_error, max_level=reference_max_level):
+        # Reference mode: refine the quadrature (tighter tolerances and more subdivisions) level by level
+        # until two successive levels agree within the tolerance and the propagated integration errors of
+        # the final level are within the tolerance as well. The reported errors are the larger of the
+        # level-to-level difference and the propagated integration error of the final level.
+        # The returned dict additionally holds 'Reference Level' and 'Converged'.
+        # The reference always uses the adaptive quadrature, whatever the selected engine is.
+        q, vec_feed, blockage = self.feed_values_linear_SI(feed)
+        previous = None
+        for level in range(max_level + 1):
+            eps = quad_error / 10**level
+            current = self.calc_efficiencies_adaptive(feed.type, q, vec_feed, aperture, blockage, epsabs=eps, epsrel=eps, 
+                                                      max_iter=max_iter * 2**level)
+            if current is None:
+                return None
+            if previous is not None:
+                taper_diff = abs(current['Taper Efficiency'] - previous['Taper Efficiency'])
+                spill_diff = abs(current['Spillover Efficiency'] - previous['Spillover Efficiency'])
+                current['Taper Error'] = max(current['Taper Error'], taper_diff)
+                current['Spillover Error'] = max(current['Spillover Error'], spill_diff)
+                if current['Taper Error'] < tolerance and current['Spillover Error'] < tolerance:
+                    current['Reference Level'] = level
+                    current['Converged'] = True
+                    return current
+            previous = current
+        previous['Reference Level'] = max_level
+        previous['Converged'] = False
+        return previous
+
+    def validate_oneshot(self, feed: Feed, aperture: Aperture, tolerance=quad_error):
+        # Compare the oneshot calculation of the selected engine against the reference mode.
+        # Returns (is_valid, fast_results, reference_results).
+        fast = self.calc_efficiencies_oneshot(feed, aperture)
+        reference = self.calc_efficiencies_reference(feed, aperture, tolerance=tolerance)
+        if fast is None or reference is None:
+            return False, fast, reference
+        is_valid = True
+        for name in ['Taper Efficiency', 'Spillover Efficiency']:
+            if abs(fast[name] - reference[name]) > tolerance + reference[name.replace('Efficiency', 'Error')]:
+                is_valid = False
+        return is_valid, fast, reference
+
+    def sweep_linspace_1d(self):
         var_name = self.parameters['Sweep Variable']
         var_start = self.parameters['Sweep Start']
         var_end = self.parameters['Sweep Stop']
         var_step = self.parameters['Sweep Steps'] 
-        var_linspace = np.linspace(var_start, var_end, var_step)
-        taper_efficiencies = []
-        spillover_efficiencies = []
+        return var_name, np.linspace(var_start, var_end, var_step)
+
+    def sweep_points_1d(self, feed: Feed, aperture: Aperture):
+        # Yields (index, feed, aperture) for each point of the 1D sweep.
+        # The general idea of sweeping is that:
+        # First store a record of the feed and aperture as a back up.
+        # In the sweep loop, for each point to be calculated, update the parameters of the feed and aperture.
+        # Note that the same feed and aperture objects are updated and yielded for every point.
+        feed_sweep = deepcopy(feed)
+        aperture_sweep = deepcopy(aperture)
+        var_name, var_linspace = self.sweep_linspace_1d()
         for i in range(len(var_linspace)):
             if var_name in feed_sweep.parameters.keys():
                 feed_sweep.update_parameter(var_name, var_linspace[i])
             else:
                 aperture_sweep.update_parameter(var_name, var_linspace[i])
-            # Calculate the taper efficiency and spillover efficiency for each point.
-            taper, spill = self.calc_taper_and_spillover_efficiency_oneshot(feed_sweep, aperture_sweep)
-            # Store these values in lists.
-            taper_efficiencies.append(taper)
-            spillover_efficiencies.append(spill)
+            yield i, feed_sweep, aperture_sweep
+
+    def sweep_taper_and_spillover_efficiencies_1d(self, feed: Feed, aperture: Aperture, progressbar=None):
+        # Returns a SweepResult holding the swept values, the efficiencies and their error estimates.
+        if not self.type == CalculationType.Sweep1D:
+            return None
+        time_start = perf_counter()
+        var_name, var_linspace = self.sweep_linspace_1d()
+        results_sweep = {name: np.zeros(len(var_linspace)) for name in RESULT_NAMES}
+        # Store the results of each point in the preallocated arrays.
+        def store_point(i, results):
+            for name in RESULT_NAMES:
+                results_sweep[name][i] = results[name]
             if progressbar is not None:
                 progressbar['value'] = int(float(i/len(var_linspace)) * 100)
                 progressbar.update_idletasks()
-        # Return the lists of taper efficiencies and spillover efficiencies.
-        return np.array(taper_efficiencies), np.array(spillover_efficiencies)
+
+        if var_name in feed.parameters.keys():
+            # Convert the feed parameters of all the points at once and feed the solver with them directly
+            feed_array = FeedArray(feed, len(var_linspace))
+            feed_array.update_parameter(var_name, var_linspace)
+            q_array = feed_array.get_parameter_linear_SI('Q')
+            vec_feed_array = feed_array.get_positions_linear_SI()
+            blockage_array = feed_array.get_blockage_linear_SI()
+            if (self.engine == CalculationEngine.FixedNodes and len(var_linspace) > 0 and np.all(vec_feed_array == vec_feed_array[0])
+                    and all(np.all(values == values[0]) for values in blockage_array)):
+                # The feed does not move (a sweep of Q, HPBW, gain or frequency), so all the points are
+                # integrated at once over the same geometry
+                blockage = (blockage_array[0][0], int(blockage_array[1][0]), blockage_array[2][0])
+                for i, results in enumerate(self.calc_efficiencies_fixed_nodes_array(feed.type, q_array, vec_feed_array[0], aperture, blockage)):
+                    store_point(i, results)
+            else:
+                for i in range(len(var_linspace)):
+                    blockage = (blockage_array[0][i], int(blockage_array[1][i]), blockage_array[2][i])
+                    store_point(i, self.calc_efficiencies_from_feed_values(feed.type, q_array[i], vec_feed_array[i], aperture, blockage))
+        else:
+            for i, feed_sweep, aperture_sweep in self.sweep_points_1d(feed, aperture):
+                store_point(i, self.calc_efficiencies_oneshot(feed_sweep, aperture_sweep))
+        # Return the swept values and the results together with the timing and the input configuration.
+        configuration = {'Feed': feed.to_dict(), 'Aperture': aperture.to_dict(), 'Calculation': self.to_dict()}
+        return SweepResult([var_name], [var_linspace], results_sweep, perf_counter() - time_start, configuration)
 
 
     def sweep_taper_and_spillover_efficiencies_2d(self, feed: Feed, aperture: Aperture):
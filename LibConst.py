@@ -9,3 +9,19 @@ tk_pady = 5
 
 quad_error = 1e-2
 max_iter = 3
+reference_max_level = 4
+
+surrogate_path = "IlluminationSurrogate"
+surrogate_safety_factor = 2.0
+surrogate_max_error = 1e-2
+
+calc_server_host = "127.0.0.1"
+calc_server_port = 8765
+calc_server_workers = None # None: one worker per CPU core
+calc_server_cache_size = 4096
+use_calc_server = False # True: the GUI runs as a thin client of the calculation server
+
+aperture_nodes_count = 64 # Gauss-Legendre nodes per dimension of the aperture
+aperture_nodes_cache_size = 32
+blockage_max_nodes_count = 512 # Largest number of nodes per dimension for the blockage of the adaptive engine
+beam_footprint_factor = 3.0 # Half power widths around the beam peak where the integration domain is split
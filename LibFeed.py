@@ -18,7 +18,7 @@ class FeedType(Enum):
 
 
 # ---------- BEGIN Feed Functions ----------
-# TODO: Reduce the numeric error when updating the feed parameters
+# All the functions accept scalars as well as NumPy arrays.
 
 def q_to_gain_lin(q):
     integrant = lambda phi, theta: cos(theta)**(2*q)*sin(theta)
@@ -41,12 +41,72 @@ def gain_dbi_to_q(gain_dbi):
 def q_to_hpbw(q):
     return 2*np.arccos(np.power(2, -1/2/q))
 def hpbw_to_q(hpbw):
-    return -3/(20*log10(np.cos(hpbw/2)))
+    # Exact inverse of q_to_hpbw: cos(hpbw/2)^(2q) = 1/2
+    # (Using -3 dB instead of 10*log10(1/2) made the round trips drift.)
+    return -np.log(2)/(2*np.log(np.cos(hpbw/2)))
 
 
 def hpbw_to_gain_dbi(hpbw):
     q = hpbw_to_q(hpbw)
     return q_to_gain_dbi(q)
+
+
+def cartesian_to_spherical(x, y, z):
+    r = np.sqrt(x**2 + y**2 + z**2)
+    theta = np.arccos(z/r)
+    phi = np.arctan2(y, x)
+    return r, theta, phi
+def spherical_to_cartesian(r, theta, phi):
+    x = r*sin(theta)*cos(phi)
+    y = r*sin(theta)*sin(phi)
+    z = r*cos(theta)
+    return x, y, z
+
+
+def update_dependent_parameters(parameters, name, value):
+    # Update the parameter and its dependent values of a cos(theta)^Q feed in the parameters dict.
+    # Works on a dict of scalars (Feed) as well as on a dict of arrays (FeedArray).
+    parameters[name] = value
+    if name == 'Freq (GHz)':
+        parameters['Wavelength (mm)'] = c/(value*1e9)*1e3
+    elif name == 'Wavelength (mm)':
+        parameters['Freq (GHz)'] = c/(value*1e-3)*1e-9
+    elif name == 'Gain (dBi)':
+        parameters['Q'] = gain_dbi_to_q(value)
+        parameters['HPBW (deg)'] = rad2deg(q_to_hpbw(parameters['Q']))
+    elif name == 'HPBW (deg)':
+        parameters['Q'] = hpbw_to_q(deg2rad(value))
+        parameters['Gain (dBi)'] = q_to_gain_dbi(parameters['Q'])
+    elif name == 'Q':
+        parameters['Gain (dBi)'] = q_to_gain_dbi(value)
+        parameters['HPBW (deg)'] = rad2deg(q_to_hpbw(value))
+    elif name == 'PosX (mm)' or name == 'PosY (mm)' or name == 'PosZ (mm)':
+        r, theta, phi = cartesian_to_spherical(parameters['PosX (mm)'], parameters['PosY (mm)'], parameters['PosZ (mm)'])
+        parameters['PosR (mm)'] = r
+        parameters['PosTheta (Deg)'] = rad2deg(theta)
+        parameters['PosPhi (Deg)'] = rad2deg(phi)
+    elif name == 'PosR (mm)' or name == 'PosTheta (Deg)' or name == 'PosPhi (Deg)':
+        x, y, z = spherical_to_cartesian(parameters['PosR (mm)'], deg2rad(parameters['PosTheta (Deg)']), deg2rad(parameters['PosPhi (Deg)']))
+        parameters['PosX (mm)'] = x
+        parameters['PosY (mm)'] = y
+        parameters['PosZ (mm)'] = z
+    elif name == 'Strut Count':
+        # A number of struts, the value is rounded to the nearest integer instead of being truncated later
+        parameters[name] = np.rint(value)
+    else:
+        pass
+
+
+def parameter_linear_SI(name, value):
+    if "mm" in name:
+        return value*1e-3
+    if "GHz" in name:
+        return value*1e9
+    if "Deg" in name:
+        return deg2rad(value)
+    if "dBi" in name:
+        return 10**(value/10)
+    return value
 # ---------- END Feed Functions ----------
 
 
@@ -69,8 +129,8 @@ class Feed:
 
             # Dependent Values: HPBW - Gain - Q
             self.parameters['HPBW (deg)'] = 20.0
-            self.parameters['Gain (dBi)'] = hpbw_to_gain_dbi(deg2rad(20))
-            self.parameters['Q'] = gain_dbi_to_q(self.parameters['Gain (dBi)'])
+            self.parameters['Q'] = hpbw_to_q(deg2rad(20))
+            self.parameters['Gain (dBi)'] = q_to_gain_dbi(self.parameters['Q'])
             
             # Dependent Values: XYZ - RThetaPhi
             self.parameters['PosX (mm)'] = 0.0
@@ -79,21 +139,35 @@ class Feed:
             self.parameters['PosR (mm)'] = 1.0
             self.parameters['PosTheta (Deg)'] = 0.0
             self.parameters['PosPhi (Deg)'] = 0.0
+
+            # Blockage of the aperture by the feed housing and its support struts (see LibBlockage)
+            self.parameters['Blockage Radius (mm)'] = 0.0
+            self.parameters['Strut Count'] = 0.0
+            self.parameters['Strut Width (mm)'] = 0.0
         else:
             pass
     
+    def to_dict(self):
+        return {'Type': self.type.value, 'Parameters': dict(self.parameters)}
+
+    @classmethod
+    def from_dict(cls, data):
+        # The dependent parameters are restored as they are, they are consistent since they were saved from a Feed
+        feed = cls()
+        feed.update_type(FeedType(data['Type']))
+        feed.parameters.update(data['Parameters'])
+        return feed
+
     def get_parameter_linear_SI(self, name):
         if name not in self.parameters:
             return None
-        if "mm" in name:
-            return self.parameters[name]*1e-3
-        if "GHz" in name:
-            return self.parameters[name]*1e9
-        if "Deg" in name:
-            return deg2rad(self.parameters[name])
-        if "dBi" in name:
-            return 10**(self.parameters[name]/10)
-        return self.parameters[name]
+        return parameter_linear_SI(name, self.parameters[name])
+
+    def get_blockage_linear_SI(self):
+        # Returns (housing radius in m, number of struts, strut width in m)
+        return (self.get_parameter_linear_SI('Blockage Radius (mm)'),
+                int(np.rint(self.parameters['Strut Count'])),
+                self.get_parameter_linear_SI('Strut Width (mm)'))
 
     def update_parameter(self, name, value):
         try:
@@ -107,42 +181,61 @@ class Feed:
             
             # Try to update the parameter, if it fails, return False and print the corresponding error message
             try:
-                self.parameters[name] = value
-                if name == 'Freq (GHz)':
-                    self.parameters['Wavelength (mm)'] = c/(value*1e9)*1e3
-                elif name == 'Wavelength (mm)':
-                    self.parameters['Freq (GHz)'] = c/(value*1e-3)*1e-9
-                elif name == 'Gain (dBi)':
-                    self.parameters['Q'] = gain_dbi_to_q(value)
-                    self.parameters['HPBW (deg)'] = rad2deg(q_to_hpbw(self.parameters['Q']))
-                elif name == 'HPBW (deg)':
-                    self.parameters['Q'] = hpbw_to_q(deg2rad(value))
-                    self.parameters['Gain (dBi)'] = q_to_gain_dbi(self.parameters['Q'])
-                elif name == 'Q':
-                    self.parameters['Gain (dBi)'] = q_to_gain_dbi(value)
-                    self.parameters['HPBW (deg)'] = rad2deg(q_to_hpbw(value))
-                elif name == 'PosX (mm)' or name == 'PosY (mm)' or name == 'PosZ (mm)':
-                    x = self.parameters['PosX (mm)']
-                    y = self.parameters['PosY (mm)']
-                    z = self.parameters['PosZ (mm)']
-                    self.parameters['PosR (mm)'] = np.sqrt(x**2 + y**2 + z**2)
-                    self.parameters['PosTheta (Deg)'] = rad2deg(np.arccos(z/self.parameters['PosR (mm)']))
-                    self.parameters['PosPhi (Deg)'] = rad2deg(np.arctan2(y, x))
-                elif name == 'PosR (mm)' or name == 'PosTheta (Deg)' or name == 'PosPhi (Deg)':
-                    r = self.parameters['PosR (mm)']
-                    theta = deg2rad(self.parameters['PosTheta (Deg)'])
-                    phi = deg2rad(self.parameters['PosPhi (Deg)'])
-                    self.parameters['PosX (mm)'] = r*sin(theta)*cos(phi)
-                    self.parameters['PosY (mm)'] = r*sin(theta)*sin(phi)
-                    self.parameters['PosZ (mm)'] = r*cos(theta)
-                else:    
-                    pass
+                update_dependent_parameters(self.parameters, name, value)
             except:
                 print("Invalid Value for {}".format(name))
                 return False
             return True
 
 
+class FeedArray:
+    # Array-based representation of N feeds of the same type, one array per parameter.
+    # The parameters are converted for all the feeds at once, which avoids the per-point
+    # Feed objects (and their deepcopy) in sweeps.
+    def __init__(self, feed: Feed, n):
+        self.type = feed.type
+        self.parameters = {name: np.full(n, value, dtype=float) for name, value in feed.parameters.items()}
+
+    def __len__(self):
+        return len(next(iter(self.parameters.values())))
+
+    def get_parameter_linear_SI(self, name):
+        if name not in self.parameters:
+            return None
+        return parameter_linear_SI(name, self.parameters[name])
+
+    def get_positions_linear_SI(self):
+        # Returns an array of shape (N, 3) of the feed positions in m
+        return np.column_stack([self.get_parameter_linear_SI('PosX (mm)'),
+                                self.get_parameter_linear_SI('PosY (mm)'),
+                                self.get_parameter_linear_SI('PosZ (mm)')])
+
+    def get_blockage_linear_SI(self):
+        # Returns (housing radii in m, numbers of struts, strut widths in m) as arrays of length N
+        return (self.get_parameter_linear_SI('Blockage Radius (mm)'),
+                np.rint(self.parameters['Strut Count']).astype(int),
+                self.get_parameter_linear_SI('Strut Width (mm)'))
+
+    def update_parameter(self, name, values):
+        # values: scalar or array of length N
+        if self.type != FeedType.Cos_theta_q or name not in self.parameters:
+            return False
+        try:
+            values = np.broadcast_to(np.asarray(values, dtype=float), (len(self),)).copy()
+        except ValueError:
+            return False
+        with np.errstate(all='ignore'):
+            update_dependent_parameters(self.parameters, name, values)
+        return True
+
+    def feed_at(self, i):
+        feed = Feed()
+        feed.update_type(self.type)
+        for name in self.parameters:
+            feed.parameters[name] = float(self.parameters[name][i])
+        return feed
+
+
 if __name__ == "__main__":
     print(np.rad2deg((q_to_hpbw(hpbw_to_q(np.deg2rad(20))))))
     print(hpbw_to_q(q_to_hpbw(2)))
@@ -0,0 +1,145 @@
+import numpy as np
+from copy import deepcopy
+from LibAperture import ApertureType, Aperture
+from LibBlockage import blockage_mask
+from LibConst import *
+
+
+# ---------- BEGIN Common Functions from Numpy ----------
+norm = np.linalg.norm
+# ---------- END Common Functions from Numpy ----------
+
+
+# ---------- BEGIN Integrand Kernels ----------
+# The kernels work on scalars as well as on arrays of points (x, y, 0) of the aperture.
+# Behind the horizon of the feed (cos_theta <= 0) and for a feed at or below the aperture plane
+# (projection <= 0) the kernels are zero instead of NaN. The powers are evaluated in the log domain,
+# so large Q neither overflows nor loses the small values to 0**Q.
+
+def incidence_geometry(x, y, vec_feed):
+    # Returns cos_theta (angle from the feed axis, which points to the aperture center),
+    # the distance from the feed and the projection of the incidence direction onto the aperture normal (-z).
+    dx = x - vec_feed[0]
+    dy = y - vec_feed[1]
+    dz = -vec_feed[2]
+    vec_incidence_len = np.sqrt(dx**2 + dy**2 + dz**2)
+    cos_theta = -(dx*vec_feed[0] + dy*vec_feed[1] + dz*vec_feed[2]) / (vec_incidence_len * norm(vec_feed))
+    projection = -dz / vec_incidence_len
+    return cos_theta, vec_incidence_len, projection
+
+def power_kernel(q, cos_theta, vec_incidence_len, projection):
+    # cos(theta)^(2Q) / d^2 * projection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_value = 2*q*np.log(cos_theta) - 2*np.log(vec_incidence_len) + np.log(projection)
+    return np.where((cos_theta > 0) & (projection > 0), np.exp(log_value), 0.0)
+
+def field_kernel(q, cos_theta, vec_incidence_len, projection):
+    # cos(theta)^Q / d * projection^0.5
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_value = q*np.log(cos_theta) - np.log(vec_incidence_len) + 0.5*np.log(projection)
+    return np.where((cos_theta > 0) & (projection > 0), np.exp(log_value), 0.0)
+
+def horizon_crosses_aperture(aperture: Aperture, vec_feed):
+    # True if a part of the aperture is behind the horizon of the feed (x*x_feed + y*y_feed >= |feed|^2),
+    # i.e. the kernels have a kink inside the aperture
+    if aperture.type == ApertureType.Circular:
+        reach = aperture.get_parameter_linear_SI('Radius (mm)') * np.hypot(vec_feed[0], vec_feed[1])
+    else:
+        # The farthest point along (x_feed, y_feed) is a corner
+        half_x, _ = aperture.get_rim_point(0.0)
+        _, half_y = aperture.get_rim_point(np.pi/2)
+        reach = half_x * abs(vec_feed[0]) + half_y * abs(vec_feed[1])
+    return bool(vec_feed[2] <= 0 or reach >= vec_feed @ vec_feed)
+
+def kernel_peaks(vec_feed, q=None):
+    # Points (x, y, scale) of the aperture plane where the kernels peak, for clustering the quadrature nodes:
+    # the nadir of the feed (1/d^2, width ~ the height of the feed) and, for a narrow beam, the beam center
+    # (width ~ the half power radius of the beam on the aperture). The beam width is rounded down to a power
+    # of 2, so that the nodes (and the geometry context) are shared by a sweep of Q.
+    peaks = [(float(vec_feed[0]), float(vec_feed[1]), float(vec_feed[2]))]
+    if q is not None and q > 0:
+        beam_width = norm(vec_feed) * np.tan(np.arccos(2.0**(-1/(2*float(q)))))
+        peaks.append((0.0, 0.0, float(2.0**np.floor(np.log2(beam_width)))))
+    return tuple(peaks)
+# ---------- END Integrand Kernels ----------
+
+
+class GeometryContext:
+    # Precomputed geometry of a feed position over the quadrature nodes of an aperture.
+    # The node coordinates, weights, distances and direction cosines are computed once and shared by the
+    # power, field and blockage integrals, and reused for every Q (or frequency) with the same geometry.
+    # Only the nodes in front of the feed are kept, the kernels are zero elsewhere.
+    # The nodes are clustered at the peaks of the kernels (see kernel_peaks), the beam center only for the Q given.
+    # If the horizon of the feed crosses the aperture, the kernels have a kink there which the fixed nodes do
+    # not resolve. The kept nodes next to the cut are marked in near_cut, see error_near_cut.
+    def __init__(self, aperture: Aperture, vec_feed, n=aperture_nodes_count, q=None):
+        self.key = GeometryContext.make_key(aperture, vec_feed, n, q)
+        self.aperture = deepcopy(aperture)
+        self.vec_feed = np.array(vec_feed, dtype=float)
+        x, y, w = aperture.get_nodes(n, kernel_peaks(self.vec_feed, q))
+        self.area = np.sum(w)
+        cos_theta, vec_incidence_len, projection = incidence_geometry(x, y, self.vec_feed)
+        valid = (cos_theta > 0) & (projection > 0)
+        self.horizon_crossed = horizon_crosses_aperture(aperture, self.vec_feed)
+        # The nodes are a tensor grid of n nodes along x (or r) times the nodes along y (or phi)
+        grid = valid.reshape(n, -1)
+        near_cut = np.zeros_like(grid)
+        near_cut[1:, :] |= ~grid[:-1, :]
+        near_cut[:-1, :] |= ~grid[1:, :]
+        if aperture.type == ApertureType.Circular:
+            # phi is periodic
+            near_cut |= ~np.roll(grid, 1, axis=1) | ~np.roll(grid, -1, axis=1)
+        else:
+            near_cut[:, 1:] |= ~grid[:, :-1]
+            near_cut[:, :-1] |= ~grid[:, 1:]
+        self.near_cut = np.ascontiguousarray(near_cut.ravel()[valid])
+        self.x = np.ascontiguousarray(x[valid])
+        self.y = np.ascontiguousarray(y[valid])
+        self.w = np.ascontiguousarray(w[valid])
+        self.cos_theta = np.ascontiguousarray(cos_theta[valid])
+        self.distance = np.ascontiguousarray(vec_incidence_len[valid])
+        self.projection = np.ascontiguousarray(projection[valid])
+        # The Q independent parts of the kernels in the log domain
+        self.log_cos_theta = np.log(self.cos_theta)
+        self.log_power_geometry = np.log(self.projection) - 2*np.log(self.distance)
+        self.log_field_geometry = 0.5*np.log(self.projection) - np.log(self.distance)
+        self.blockage_masks = {}
+
+    @staticmethod
+    def make_key(aperture: Aperture, vec_feed, n=aperture_nodes_count, q=None):
+        return (aperture.type, tuple(sorted(aperture.parameters.items())), n, kernel_peaks(vec_feed, q))
+
+    def matches(self, aperture: Aperture, vec_feed, n=aperture_nodes_count, q=None):
+        return self.key == GeometryContext.make_key(aperture, vec_feed, n, q)
+
+    def power_integral(self, q):
+        # Integral of cos(theta)^(2Q) / d^2 * projection over the aperture. q may be an array of Q values.
+        return np.exp(np.multiply.outer(2*np.asarray(q), self.log_cos_theta) + self.log_power_geometry) @ self.w
+
+    def field(self, q):
+        # cos(theta)^Q / d * projection^0.5 at the nodes
+        return np.exp(q*self.log_cos_theta + self.log_field_geometry)
+
+    def field_integral(self, q):
+        # Integral of the field over the aperture. q may be an array of Q values.
+        return np.exp(np.multiply.outer(np.asarray(q), self.log_cos_theta) + self.log_field_geometry) @ self.w
+
+    def error_near_cut(self, q):
+        # Returns the power and field integrals over the nodes next to the horizon cut (q may be an array). Where the cut falls
+        # between these nodes is not resolved, so they are used as an estimate (not a bound) of the error
+        # the kink adds to power_integral and field_integral.
+        if not self.horizon_crossed or not np.any(self.near_cut):
+            return 0.0, 0.0
+        w = self.w[self.near_cut]
+        log_cos_theta = self.log_cos_theta[self.near_cut]
+        power = np.exp(np.multiply.outer(2*np.asarray(q), log_cos_theta) + self.log_power_geometry[self.near_cut]) @ w
+        field = np.exp(np.multiply.outer(np.asarray(q), log_cos_theta) + self.log_field_geometry[self.near_cut]) @ w
+        return power, field
+
+    def blockage_mask(self, housing_radius, strut_count, strut_width):
+        # Shadow of the feed and its struts over the nodes, cached per blockage geometry
+        key = (housing_radius, strut_count, strut_width)
+        if key not in self.blockage_masks:
+            self.blockage_masks[key] = blockage_mask(self.x, self.y, self.vec_feed, self.aperture,
+                                                     housing_radius, strut_count, strut_width)
+        return self.blockage_masks[key]
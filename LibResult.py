@@ -0,0 +1,118 @@
+import json
+import os
+import numpy as np
+
+
+# Names of the result columns, in the order they are exported.
+# 'Reliable' is 1 if the errors of the point can be trusted and 0 otherwise (e.g. the feed does not
+# illuminate the aperture, or the horizon of the feed crosses the aperture for the fixed node quadrature).
+RESULT_NAMES = ['Taper Efficiency', 'Spillover Efficiency', 'Taper Error', 'Spillover Error', 'Blockage Efficiency', 'Reliable']
+
+
+class SweepResult:
+    # A container keeping the swept values, the efficiencies, their error estimates, the timing and
+    # the input configuration together.
+    # variable_names: list of the swept parameter names, one per sweep dimension
+    # values: list of 1D arrays of the swept values, one per sweep dimension
+    # results: dict of arrays with shape (len(values[0]), len(values[1]), ...), keyed by RESULT_NAMES
+    # elapsed_time: wall clock time of the calculation in seconds
+    # configuration: dict describing the feed, the aperture and the calculation (see the to_dict methods)
+    def __init__(self, variable_names, values, results, elapsed_time=0.0, configuration=None):
+        self.variable_names = list(variable_names)
+        self.values = [np.asarray(v) for v in values]
+        self.results = results
+        self.elapsed_time = elapsed_time
+        self.configuration = configuration if configuration is not None else {}
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+    def shape(self):
+        return tuple(len(v) for v in self.values)
+
+    def aperture_efficiency(self):
+        return self.results['Taper Efficiency'] * self.results['Spillover Efficiency']
+
+    def metadata(self):
+        meta = {}
+        meta['Variable Names'] = self.variable_names
+        meta['Result Names'] = [name for name in RESULT_NAMES if name in self.results]
+        meta['Elapsed Time (s)'] = self.elapsed_time
+        meta['Configuration'] = self.configuration
+        return meta
+
+    def columns(self):
+        # Returns a dict of the swept values and the results, the arrays are not copied.
+        cols = {}
+        for k, name in enumerate(self.variable_names):
+            cols['Variable {}'.format(k)] = self.values[k]
+        for name in RESULT_NAMES:
+            if name in self.results:
+                cols[name] = self.results[name]
+        return cols
+
+    # ---------- BEGIN Export Functions ----------
+    def to_npz(self, path):
+        # The arrays are written as they are, the metadata is stored as a JSON string
+        np.savez(path, _metadata=np.array(json.dumps(self.metadata())), **self.columns())
+
+    def to_csv(self, path):
+        # One row per calculated point. For multi-dimensional sweeps the swept values are expanded to a grid.
+        grids = np.meshgrid(*self.values, indexing='ij')
+        names = list(self.variable_names)
+        data = [g.ravel() for g in grids]
+        for name in RESULT_NAMES:
+            if name in self.results:
+                names.append(name)
+                data.append(np.ravel(self.results[name]))
+        np.savetxt(path, np.column_stack(data), delimiter=',', header=','.join(names), comments='')
+
+    def to_columns(self, path):
+        # Column files: a directory with one .npy file per column and a metadata.json file.
+        # These files can be memory-mapped by load_columns, so large results are loaded lazily.
+        os.makedirs(path, exist_ok=True)
+        for name, column in self.columns().items():
+            np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(column))
+        with open(os.path.join(path, "metadata.json"), "w") as f:
+            json.dump(self.metadata(), f, indent=4)
+
+    def save(self, path):
+        # Select the format from the extension of the path, column files otherwise
+        if path.endswith(".npz"):
+            self.to_npz(path)
+        elif path.endswith(".csv"):
+            self.to_csv(path)
+        else:
+            self.to_columns(path)
+    # ---------- END Export Functions ----------
+
+    # ---------- BEGIN Import Functions ----------
+    @classmethod
+    def from_columns(cls, meta, columns):
+        values = [columns['Variable {}'.format(k)] for k in range(len(meta['Variable Names']))]
+        results = {name: columns[name] for name in meta['Result Names']}
+        return cls(meta['Variable Names'], values, results, meta['Elapsed Time (s)'], meta['Configuration'])
+
+    @classmethod
+    def load_columns(cls, path, mmap=True):
+        with open(os.path.join(path, "metadata.json"), "r") as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        names = ['Variable {}'.format(k) for k in range(len(meta['Variable Names']))] + meta['Result Names']
+        columns = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode) for name in names}
+        return cls.from_columns(meta, columns)
+
+    @classmethod
+    def load_npz(cls, path):
+        # Note that .npz files can not be memory-mapped, prefer column files for large results
+        npz = np.load(path)
+        meta = json.loads(str(npz['_metadata']))
+        names = ['Variable {}'.format(k) for k in range(len(meta['Variable Names']))] + meta['Result Names']
+        return cls.from_columns(meta, {name: npz[name] for name in names})
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(".npz"):
+            return cls.load_npz(path)
+        return cls.load_columns(path)
+    # ---------- END Import Functions ----------
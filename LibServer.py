@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import sys
+import http.client
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import numpy as np
+from LibAperture import Aperture
+from LibFeed import Feed
+from LibCalc import CalculationType, CalculationEngine, Calculation
+from LibResult import SweepResult, RESULT_NAMES
+from LibConst import *
+
+
+# A small local calculation server, so that several GUI clients share one worker pool and the
+# results of identical calculations.
+# Protocol (HTTP/1.1, JSON bodies, see the to_dict methods of Feed, Aperture and Calculation):
+#   GET  /status   -> {'Jobs': <number of cached and running jobs>, 'Workers': <number of workers>}
+#   POST /oneshot  {'Feed': ..., 'Aperture': ..., 'Engine': ... (optional)} -> the dict of Calculation.calc_efficiencies_oneshot
+#   POST /sweep    {'Feed': ..., 'Aperture': ..., 'Calculation': ...} -> chunked stream of JSON lines:
+#                  {'Variable Name': ..., 'Values': [...]} first, then one {'Index': i, <results>} per point
+#                  in the order of completion, then {'Done': true}
+
+
+# ---------- BEGIN Worker Functions ----------
+def validate_parameters(cls, data):
+    # from_dict restores the parameters as they are, so they are applied to the defaults of the type
+    # with update_parameter instead, which rejects the unknown parameters and the invalid values (as the GUI does)
+    obj = cls.from_dict(dict(data, Parameters={}))
+    for name, value in data['Parameters'].items():
+        if not obj.update_parameter(name, value):
+            raise ValueError("Invalid value {} for {}".format(value, name))
+
+
+def validate_job(job):
+    # Raises ValueError or KeyError for an invalid request, before the job is sent to a worker.
+    # Any error raised later in the worker is a failed calculation instead.
+    validate_parameters(Feed, job['Feed'])
+    validate_parameters(Aperture, job['Aperture'])
+    CalculationEngine(job['Engine'])
+
+
+def calc_oneshot_job(job):
+    # Runs in a worker process, so it only takes and returns plain data
+    feed = Feed.from_dict(job['Feed'])
+    aperture = Aperture.from_dict(job['Aperture'])
+    calculation = Calculation()
+    calculation.update_engine(CalculationEngine(job['Engine']))
+    return calculation.calc_efficiencies_oneshot(feed, aperture)
+# ---------- END Worker Functions ----------
+
+
+class CalcServer:
+    def __init__(self, host=calc_server_host, port=calc_server_port, workers=calc_server_workers, cache_size=calc_server_cache_size):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.cache_size = cache_size
+        self.pool = None
+        # Running and finished jobs keyed by their canonical JSON, identical requests share one future
+        self.jobs = OrderedDict()
+
+    def submit(self, feed_dict, aperture_dict, engine=CalculationEngine.Adaptive.value):
+        job = {'Feed': feed_dict, 'Aperture': aperture_dict, 'Engine': engine}
+        key = json.dumps(job, sort_keys=True)
+        future = self.jobs.get(key)
+        # Reuse the running or finished job, unless it has failed or was cancelled
+        # (future.exception() raises CancelledError on a cancelled future, so check that first)
+        if future is not None and not (future.done() and (future.cancelled() or future.exception() is not None)):
+            self.jobs.move_to_end(key)
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, calc_oneshot_job, job)
+        self.jobs[key] = future
+        # Forget the least recently used jobs, clients awaiting them still hold their futures
+        while len(self.jobs) > self.cache_size:
+            self.jobs.popitem(last=False)
+        return future
+
+    # ---------- BEGIN HTTP Functions ----------
+    @staticmethod
+    async def write_response(writer, status, body):
+        data = json.dumps(body).encode()
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}.get(status, "Error")
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(status, reason, len(data)).encode())
+        writer.write(data)
+        await writer.drain()
+
+    @staticmethod
+    async def write_chunk(writer, body):
+        data = (json.dumps(body) + "\n").encode()
+        writer.write("{:x}\r\n".format(len(data)).encode() + data + b"\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def result_of(future):
+        # The job may be shared with other clients, so a client going away must not cancel it
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # The job itself was cancelled, e.g. by the shutdown of the pool
+                raise RuntimeError("The calculation was cancelled")
+            raise
+
+    async def handle(self, reader, writer):
+        try:
+            # Read and validate the request before anything is sent to the workers, so that an invalid
+            # request is reported as 400 and an error of the calculation in the worker as 500
+            try:
+                request_line = await reader.readline()
+                method, path, _ = request_line.decode().split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                request = json.loads(body) if body else {}
+                if method == "POST" and path == "/oneshot":
+                    job = {'Feed': request['Feed'], 'Aperture': request['Aperture'],
+                           'Engine': request.get('Engine', CalculationEngine.Adaptive.value)}
+                    validate_job(job)
+                elif method == "POST" and path == "/sweep":
+                    sweep = self.prepare_sweep(request)
+            except (ValueError, KeyError, TypeError, asyncio.IncompleteReadError) as e:
+                await self.write_response(writer, 400, {'Error': str(e)})
+                return
+
+            if method == "GET" and path == "/status":
+                await self.write_response(writer, 200, {'Jobs': len(self.jobs), 'Workers': self.workers or os.cpu_count()})
+            elif method == "POST" and path == "/oneshot":
+                results = await self.result_of(self.submit(job['Feed'], job['Aperture'], job['Engine']))
+                await self.write_response(writer, 200, results)
+            elif method == "POST" and path == "/sweep":
+                await self.handle_sweep(sweep, writer)
+            else:
+                await self.write_response(writer, 404, {'Error': "Unknown request {} {}".format(method, path)})
+        except ConnectionError:
+            pass
+        except Exception as e:
+            # The calculation has failed in the worker
+            await self.write_response(writer, 500, {'Error': str(e)})
+        finally:
+            writer.close()
+
+    @staticmethod
+    def prepare_sweep(request):
+        # Returns the sweep points as a list of (index, feed dict, aperture dict), raises ValueError or
+        # KeyError for an invalid request
+        for cls, data in ((Feed, request['Feed']), (Aperture, request['Aperture']), (Calculation, request['Calculation'])):
+            validate_parameters(cls, data)
+        feed = Feed.from_dict(request['Feed'])
+        aperture = Aperture.from_dict(request['Aperture'])
+        calculation = Calculation.from_dict(request['Calculation'])
+        if calculation.type != CalculationType.Sweep1D:
+            raise ValueError("Unsupported calculation type {}".format(calculation.type.value))
+        var_name = calculation.parameters['Sweep Variable']
+        if var_name not in Calculation.sweep_variable_names(feed, aperture):
+            raise ValueError("Invalid Sweep Variable {}".format(var_name))
+        points = [(i, feed_sweep.to_dict(), aperture_sweep.to_dict())
+                  for i, feed_sweep, aperture_sweep in calculation.sweep_points_1d(feed, aperture)]
+        return calculation, points
+
+    async def handle_sweep(self, sweep, writer):
+        calculation, points = sweep
+        # Submit all points at once, so that they are calculated in parallel
+        async def indexed(i, future):
+            return i, await self.result_of(future)
+        pending = [indexed(i, self.submit(feed_dict, aperture_dict, calculation.engine.value))
+                   for i, feed_dict, aperture_dict in points]
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        var_name, var_linspace = calculation.sweep_linspace_1d()
+        await self.write_chunk(writer, {'Variable Name': var_name, 'Values': var_linspace.tolist()})
+        try:
+            for coro in asyncio.as_completed(pending):
+                i, results = await coro
+                await self.write_chunk(writer, dict(results, Index=i))
+            await self.write_chunk(writer, {'Done': True})
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # The response has already started, so the error is reported in the stream
+            await self.write_chunk(writer, {'Error': str(e)})
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    # ---------- END HTTP Functions ----------
+
+    async def serve(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print("Calculation server listening on {}:{}".format(self.host, self.port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+
+class CalcClient:
+    # A thin client with the same calculation methods as Calculation, for the GUI to run against a CalcServer
+    def __init__(self, host=calc_server_host, port=calc_server_port, timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, timeout=None):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=timeout if timeout is not None else self.timeout)
+        data = json.dumps(body) if body is not None else None
+        connection.request(method, path, body=data, headers={'Content-Type': 'application/json'})
+        return connection, connection.getresponse()
+
+    def is_available(self, timeout=0.5):
+        try:
+            connection, response = self.request("GET", "/status", timeout=timeout)
+            connection.close()
+            return response.status == 200
+        except OSError:
+            return False
+
+    def calc_efficiencies_oneshot(self, feed: Feed, aperture: Aperture, engine=CalculationEngine.Adaptive):
+        connection, response = self.request("POST", "/oneshot", {'Feed': feed.to_dict(), 'Aperture': aperture.to_dict(), 'Engine': engine.value})
+        results = json.loads(response.read())
+        connection.close()
+        if response.status != 200:
+            raise RuntimeError(results['Error'])
+        return results
+
+    def sweep_taper_and_spillover_efficiencies_1d(self, calculation: Calculation, feed: Feed, aperture: Aperture, progressbar=None):
+        # Same as Calculation.sweep_taper_and_spillover_efficiencies_1d, the points are streamed back as they complete.
+        if not calculation.type == CalculationType.Sweep1D:
+            return None
+        time_start = perf_counter()
+        configuration = {'Feed': feed.to_dict(), 'Aperture': aperture.to_dict(), 'Calculation': calculation.to_dict()}
+        connection, response = self.request("POST", "/sweep", configuration)
+        if response.status != 200:
+            error = json.loads(response.read())['Error']
+            connection.close()
+            raise RuntimeError(error)
+        header = json.loads(response.readline())
+        var_linspace = np.array(header['Values'])
+        results_sweep = {name: np.zeros(len(var_linspace)) for name in RESULT_NAMES}
+        n_done = 0
+        for line in response:
+            point = json.loads(line)
+            if point.get('Done'):
+                break
+            if 'Error' in point:
+                connection.close()
+                raise RuntimeError(point['Error'])
+            for name in RESULT_NAMES:
+                results_sweep[name][point['Index']] = point[name]
+            n_done += 1
+            if progressbar is not None:
+                progressbar['value'] = int(float(n_done/len(var_linspace)) * 100)
+                progressbar.update_idletasks()
+        connection.close()
+        return SweepResult([header['Variable Name']], [var_linspace], results_sweep, perf_counter() - time_start, configuration)
+
+
+if __name__ == "__main__":
+    # Usage: python LibServer.py [port]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else calc_server_port
+    asyncio.run(CalcServer(port=port).serve())
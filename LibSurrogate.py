@@ -0,0 +1,216 @@
+import json
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+from LibAperture import ApertureType, Aperture
+from LibFeed import FeedType, Feed
+from LibCalc import CalculationEngine, Calculation
+from LibConst import *
+
+
+# The efficiencies of a cos(theta)^Q feed are scale invariant, so the surrogate table is built
+# over normalized parameters:
+#   Height Ratio       = PosR / characteristic half-size of the aperture
+#   Offset Angle (Deg) = PosTheta of the feed
+#   Log10 Q            = log10 of the feed Q
+# The characteristic half-size is the radius (Circular), half of the width (Square) or half of
+# the X length (Rectangular, the Y/X aspect ratio is fixed when the table is built).
+# The feed is assumed to point to the aperture center, as in LibCalc, and not to block the aperture.
+
+SURROGATE_AXES = ['Height Ratio', 'Offset Angle (Deg)', 'Log10 Q']
+SURROGATE_OUTPUTS = ['Taper Efficiency', 'Spillover Efficiency']
+
+
+# ---------- BEGIN Normalization Functions ----------
+def aperture_half_size_and_aspect(aperture: Aperture):
+    if aperture.type == ApertureType.Circular:
+        return aperture.parameters['Radius (mm)'], 1.0
+    if aperture.type == ApertureType.Square:
+        return aperture.parameters['Width (mm)'] / 2, 1.0
+    if aperture.type == ApertureType.Rectangular:
+        x_length = aperture.parameters['X Length (mm)']
+        return x_length / 2, aperture.parameters['Y Length (mm)'] / x_length
+    return None, None
+
+
+def normalize_feed_and_aperture(feed: Feed, aperture: Aperture):
+    half_size, _ = aperture_half_size_and_aspect(aperture)
+    height_ratio = feed.parameters['PosR (mm)'] / half_size
+    offset_angle = feed.parameters['PosTheta (Deg)']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log10_q = np.log10(feed.parameters['Q'])
+    return np.array([height_ratio, offset_angle, log10_q])
+
+
+def build_normalized_feed_and_aperture(aperture_type, aspect, phi_deg, height_ratio, offset_angle, log10_q):
+    # Create a unit size aperture and a feed with the given normalized parameters.
+    aperture = Aperture()
+    aperture.update_type(aperture_type)
+    if aperture_type == ApertureType.Circular:
+        aperture.update_parameter('Radius (mm)', 1.0)
+    elif aperture_type == ApertureType.Square:
+        aperture.update_parameter('Width (mm)', 2.0)
+    elif aperture_type == ApertureType.Rectangular:
+        aperture.update_parameter('X Length (mm)', 2.0)
+        aperture.update_parameter('Y Length (mm)', 2.0 * aspect)
+    feed = Feed()
+    feed.update_parameter('Q', 10**log10_q)
+    feed.update_parameter('PosR (mm)', height_ratio)
+    feed.update_parameter('PosTheta (Deg)', offset_angle)
+    feed.update_parameter('PosPhi (Deg)', phi_deg)
+    return feed, aperture
+# ---------- END Normalization Functions ----------
+
+
+class Surrogate:
+    def __init__(self, axes, table, error_estimates, aperture_type, aspect=1.0, phi_deg=0.0):
+        # axes: list of 1D arrays, one per entry of SURROGATE_AXES
+        # table: array of shape (len(axes[0]), len(axes[1]), len(axes[2]), len(SURROGATE_OUTPUTS))
+        # error_estimates: array of shape (len(axes[0])-1, len(axes[1])-1, len(axes[2])-1), one error estimate
+        #                  per cell. NaN marks a cell where the exact solver failed, such a cell is never used.
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.table = table
+        self.error_estimates = error_estimates
+        self.aperture_type = aperture_type
+        self.aspect = aspect
+        self.phi_deg = phi_deg
+        # The interpolator works directly on the (possibly memory-mapped) table without copying it
+        self.interpolator = RegularGridInterpolator(tuple(self.axes), self.table, method='linear', bounds_error=False, fill_value=None)
+
+    @classmethod
+    def build(cls, aperture_type=ApertureType.Circular, aspect=1.0, phi_deg=0.0,
+              height_ratios=None, offset_angles=None, log10_qs=None, progressbar=None):
+        # Build the table with the exact solver, then compare the interpolation at every cell center
+        # against the exact solver to obtain the error estimate of each cell.
+        # The efficiencies change fastest for a low feed, so the height ratios are spaced geometrically.
+        # With the default axes every cell of the circular table is estimated within surrogate_max_error.
+        if height_ratios is None:
+            height_ratios = np.geomspace(0.5, 5.0, 30)
+        if offset_angles is None:
+            offset_angles = np.linspace(0.0, 60.0, 13)
+        if log10_qs is None:
+            log10_qs = np.linspace(0.0, 2.5, 41)
+        axes = [np.asarray(height_ratios, dtype=float), np.asarray(offset_angles, dtype=float), np.asarray(log10_qs, dtype=float)]
+        # The fixed node engine integrates all the Q values of a feed position at once, and falls back to the
+        # adaptive quadrature where its error estimate exceeds quad_error
+        calculation = Calculation()
+        calculation.update_engine(CalculationEngine.FixedNodes)
+
+        def exact(height_ratio, offset_angle, log10_qs):
+            # Returns the efficiencies, shape (len(log10_qs), len(SURROGATE_OUTPUTS)), and the larger of the
+            # integration errors of each Q
+            feed, aperture = build_normalized_feed_and_aperture(aperture_type, aspect, phi_deg, height_ratio, offset_angle, 0.0)
+            _, vec_feed, blockage = calculation.feed_values_linear_SI(feed)
+            results = calculation.calc_efficiencies_fixed_nodes_array(feed.type, 10**np.asarray(log10_qs), vec_feed, aperture, blockage)
+            values = np.array([[r[name] for name in SURROGATE_OUTPUTS] for r in results])
+            # np.max propagates NaN, so the points where the exact solver failed stay marked
+            quad_errors = np.array([np.max([r['Taper Error'], r['Spillover Error']]) for r in results])
+            return values, quad_errors
+
+        shape = tuple(len(axis) for axis in axes)
+        table = np.zeros(shape + (len(SURROGATE_OUTPUTS),))
+        n_total = shape[0] * shape[1]
+        for n, (i, j) in enumerate(np.ndindex(shape[:2])):
+            table[i, j], _ = exact(axes[0][i], axes[1][j], axes[2])
+            if progressbar is not None:
+                progressbar['value'] = int(float(n/n_total) * 50)
+                progressbar.update_idletasks()
+
+        centers = [(axis[1:] + axis[:-1]) / 2 for axis in axes]
+        center_shape = tuple(len(center) for center in centers)
+        error_estimates = np.zeros(center_shape)
+        surrogate = cls(axes, table, error_estimates, aperture_type, aspect, phi_deg)
+
+        # Cell centers are the points farthest away from the table nodes, thus the worst case of a linear
+        # interpolation if the efficiencies are smooth within the cell. The error is an estimate, not a bound.
+        n_total = center_shape[0] * center_shape[1]
+        for n, (i, j) in enumerate(np.ndindex(center_shape[:2])):
+            exact_values, quad_errors = exact(centers[0][i], centers[1][j], centers[2])
+            points = np.column_stack([np.full(center_shape[2], centers[0][i]), np.full(center_shape[2], centers[1][j]), centers[2]])
+            interp_errors = np.max(np.abs(surrogate.interpolator(points) - exact_values), axis=1)
+            error_estimates[i, j] = surrogate_safety_factor * interp_errors + quad_errors
+            if progressbar is not None:
+                progressbar['value'] = 50 + int(float(n/n_total) * 50)
+                progressbar.update_idletasks()
+
+        return surrogate
+
+    def save(self, path):
+        # The table and the error estimates are saved as <path>.npy and <path>_error.npy (so that they can
+        # be memory-mapped), the axes and the metadata are saved as <path>.json.
+        np.save(path + ".npy", np.ascontiguousarray(self.table))
+        np.save(path + "_error.npy", np.ascontiguousarray(self.error_estimates))
+        meta = {}
+        meta['Axes Names'] = SURROGATE_AXES
+        meta['Output Names'] = SURROGATE_OUTPUTS
+        meta['Axes'] = [axis.tolist() for axis in self.axes]
+        meta['Aperture Type'] = self.aperture_type.value
+        meta['Aspect'] = self.aspect
+        meta['PosPhi (Deg)'] = self.phi_deg
+        with open(path + ".json", "w") as f:
+            json.dump(meta, f, indent=4)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        # Returns None if the surrogate files do not exist.
+        try:
+            with open(path + ".json", "r") as f:
+                meta = json.load(f)
+            table = np.load(path + ".npy", mmap_mode='r' if mmap else None)
+            error_estimates = np.load(path + "_error.npy", mmap_mode='r' if mmap else None)
+        except (OSError, ValueError):
+            return None
+        return cls(meta['Axes'], table, error_estimates, ApertureType(meta['Aperture Type']),
+                   meta['Aspect'], meta['PosPhi (Deg)'])
+
+    def cell_error_estimate(self, point):
+        index = []
+        for k in range(len(self.axes)):
+            i = np.searchsorted(self.axes[k], point[k], side='right') - 1
+            index.append(min(max(i, 0), len(self.axes[k]) - 2))
+        return self.error_estimates[tuple(index)]
+
+    def is_applicable(self, feed: Feed, aperture: Aperture, max_error=surrogate_max_error):
+        if feed.type != FeedType.Cos_theta_q or aperture.type != self.aperture_type:
+            return False
+        housing_radius, strut_count, strut_width = feed.get_blockage_linear_SI()
+        if housing_radius > 0 or (strut_count > 0 and strut_width > 0):
+            return False
+        _, aspect = aperture_half_size_and_aspect(aperture)
+        if not np.isclose(aspect, self.aspect):
+            return False
+        # The azimuth of the feed only matters for the non-circular apertures (unless it is on the axis)
+        if aperture.type != ApertureType.Circular and feed.parameters['PosTheta (Deg)'] != 0:
+            if not np.isclose(feed.parameters['PosPhi (Deg)'], self.phi_deg):
+                return False
+        point = normalize_feed_and_aperture(feed, aperture)
+        # A negative Q (Gain < 3 dBi) gives a NaN log10 Q, which must not pass the range check
+        for k in range(len(self.axes)):
+            if not (self.axes[k][0] <= point[k] <= self.axes[k][-1]):
+                return False
+        # Comparison with NaN is False, so the failed cells are rejected as well
+        return bool(self.cell_error_estimate(point) <= max_error)
+
+    def query(self, feed: Feed, aperture: Aperture, max_error=surrogate_max_error):
+        # Returns the same dict as Calculation.calc_efficiencies_oneshot, or None if the feed and the
+        # aperture are outside of the domain of the surrogate or the local error estimate exceeds max_error.
+        # In that case the exact solver should be used instead.
+        if not self.is_applicable(feed, aperture, max_error):
+            return None
+        point = normalize_feed_and_aperture(feed, aperture)
+        interpolated = self.interpolator(point)[0]
+        error_estimate = float(self.cell_error_estimate(point))
+        results = {}
+        results['Taper Efficiency'] = float(interpolated[0])
+        results['Spillover Efficiency'] = float(interpolated[1])
+        results['Taper Error'] = error_estimate
+        results['Spillover Error'] = error_estimate
+        results['Blockage Efficiency'] = 1.0
+        results['Reliable'] = True
+        return results
+
+
+if __name__ == "__main__":
+    # Build the default surrogate used by the GUI
+    surrogate = Surrogate.build()
+    surrogate.save(surrogate_path)
+    print("Saved surrogate to {} with the largest cell error estimate {:.2e}".format(surrogate_path, np.nanmax(surrogate.error_estimates)))
@@ -2,8 +2,44 @@ from tkinter import ttk
 import tkinter as tk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from matplotlib.pyplot import Figure
+import numpy as np
 from LibConst import *
 
+
+# Min/max decimation of a trace for plotting.
+# Keeps the first and the last point, and the minimum and the maximum of each bin of the visible range,
+# so that the drawn trace looks the same as the full trace at the resolution of the screen.
+def decimate_min_max(x, y, x_min, x_max, n_bins):
+    # x must be ascending (see sort_trace), the limits may be given in either order (e.g. an inverted axis)
+    x_min, x_max = min(x_min, x_max), max(x_min, x_max)
+    # Visible range, extended by one point on each side so that the lines reach the axes border
+    i0 = max(np.searchsorted(x, x_min, side='left') - 1, 0)
+    i1 = min(np.searchsorted(x, x_max, side='right') + 1, len(x))
+    if i1 - i0 <= 2 * n_bins:
+        return x[i0:i1], y[i0:i1]
+    y_visible = y[i0:i1]
+    bin_size = len(y_visible) // n_bins
+    n_binned = bin_size * n_bins
+    bins = y_visible[:n_binned].reshape(n_bins, bin_size)
+    offsets = np.arange(n_bins) * bin_size
+    indices = [offsets + np.argmin(bins, axis=1), offsets + np.argmax(bins, axis=1), [0, len(y_visible) - 1]]
+    if n_binned < len(y_visible):
+        rest = y_visible[n_binned:]
+        indices.append([n_binned + np.argmin(rest), n_binned + np.argmax(rest)])
+    indices = np.unique(np.concatenate(indices)) + i0
+    return x[indices], y[indices]
+
+
+def sort_trace(x, y):
+    # Returns the trace with ascending x, e.g. for a sweep with Sweep Start > Sweep Stop
+    if len(x) < 2 or np.all(x[1:] >= x[:-1]):
+        return x, y
+    if np.all(x[1:] <= x[:-1]):
+        return x[::-1], y[::-1]
+    order = np.argsort(x, kind='stable')
+    return x[order], y[order]
+
+
 class LabelEntryPair(ttk.Frame):
     def __init__(self, master, label_text, entry_textvar):
         super().__init__(master)
@@ -59,31 +95,87 @@ class TracePlotWindow(tk.Toplevel):
         self.bind("<Return>", self.on_ok)
         self.protocol("WM_DELETE_WINDOW", self.on_closing) # Ensure the window is properly sized before returning
         self.withdraw() # Hide the window initially
+        # Full data of each trace (label -> [x, y, line]), only the decimated data is handed to matplotlib
+        self.traces = {}
+        self.axes.callbacks.connect('xlim_changed', self.on_xlim_changed)
     
     def on_closing(self):
         self.destroy()
     
     def on_ok(self):
         pass
-    def add_trace(self, x, y, label="trace"):
-        # TODO: Add Interfaces to define line type and color
-        self.axes.plot(x, y, label=label)
+    def get_decimation_bins(self):
+        # One bin per horizontal pixel of the axes
+        return max(int(self.axes.bbox.width), 1)
+
+    def decimate(self, x, y):
+        if len(x) == 0:
+            return x, y
+        if self.axes.get_autoscalex_on():
+            x_min, x_max = x[0], x[-1]
+        else:
+            x_min, x_max = self.axes.get_xlim()
+        return decimate_min_max(x, y, x_min, x_max, self.get_decimation_bins())
+
+    def on_xlim_changed(self, axes):
+        # Re-decimate the traces for the new view range (zoom and pan)
+        for x, y, line in self.traces.values():
+            line.set_data(*decimate_min_max(x, y, *axes.get_xlim(), self.get_decimation_bins()))
+        self.canvas.draw_idle()
+
+    def add_trace(self, x, y, label="trace", **line_options):
+        # line_options are passed to matplotlib, e.g. linestyle, marker or color
+        x, y = sort_trace(np.asarray(x), np.asarray(y))
+        line, = self.axes.plot(*self.decimate(x, y), label=label, **line_options)
+        self.traces[label] = [x, y, line]
         self.axes.legend()
-        self.canvas.draw()
+        self.canvas.draw_idle()
         self.update_idletasks() # Ensure the plot is properly updated before returning
+
+    def append_points(self, label, x, y):
+        # Append points to an existing trace (or create it), only this trace is updated
+        if label not in self.traces:
+            self.add_trace(x, y, label)
+            return
+        trace = self.traces[label]
+        trace[0], trace[1] = sort_trace(np.concatenate([trace[0], np.atleast_1d(x)]),
+                                        np.concatenate([trace[1], np.atleast_1d(y)]))
+        trace[2].set_data(*self.decimate(trace[0], trace[1]))
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.canvas.draw_idle()
+        self.update_idletasks()
+
+    def add_image(self, x, y, z, label=""):
+        # Render a 2D result z[i, j] over x[i] and y[j] as an image (resampled by matplotlib to the screen)
+        x = np.asarray(x)
+        y = np.asarray(y)
+        image = self.axes.imshow(np.asarray(z).T, origin='lower', aspect='auto', interpolation='nearest',
+                                 extent=[x[0], x[-1], y[0], y[-1]])
+        self.axes.grid(False)
+        self.figure.colorbar(image, ax=self.axes, label=label)
+        self.canvas.draw_idle()
+        self.update_idletasks()
     
     def set_x_label(self, label):
         self.axes.set_xlabel(label)
-        self.canvas.draw()
+        self.canvas.draw_idle()
+        self.update_idletasks()
+
+    def set_y_label(self, label):
+        self.axes.set_ylabel(label)
+        self.canvas.draw_idle()
         self.update_idletasks()
 
     def set_title(self, title):
         self.axes.set_title(title)
-        self.canvas.draw()
+        self.canvas.draw_idle()
         self.update_idletasks()
 
     def clear_plot(self):
         self.axes.clear()
+        self.traces.clear()
+        self.axes.callbacks.connect('xlim_changed', self.on_xlim_changed)
         self.canvas.draw()
         self.update_idletasks() # Ensure the plot is properly updated before returning
 